@@ -0,0 +1,171 @@
+"""离线压测：本地模拟LLM接口和Telegram出站接口，按目标速率回放合成消息
+
+用法示例：
+    python3 benchmark.py --users 500 --rate 100 --messages 3000
+    python3 benchmark.py --stream --latency 0.8 --error-rate 0.05 --db none
+    python3 benchmark.py --hedge --latency 0.3 --backup-latency 0.5
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from telegram import Update
+
+import bot
+from llm import LLMRouter
+from mock_servers import MockLLMServer, MockTelegramBot
+
+OPENERS = ["在吗", "你好", "hi", "早", "晚安", "在干嘛"]
+TOPICS = ["今天上班好累啊", "刚看完一部电影", "晚饭吃了火锅", "明天要考试了好紧张", "猫又把杯子打翻了", "周末想去爬山"]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+def make_update(update_id, user_id, text):
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "bench", "username": f"user{user_id}"},
+            "text": text
+        }
+    }
+    return Update.de_json(data, None)
+
+def synthetic_text(rng, opener_ratio):
+    if rng.random() < opener_ratio:
+        return rng.choice(OPENERS)
+    return f"{rng.choice(TOPICS)} #{rng.randrange(1000)}"
+
+def configure(args, llm_urls):
+    """把压测参数写进bot模块的配置，再创建处理器"""
+    bot.STREAM_REPLY = args.stream
+    bot.TYPING_DELAY = args.typing_delay
+    bot.MAX_IN_FLIGHT = args.max_in_flight
+    bot.COALESCE_WINDOW_MS = args.coalesce_ms
+    bot.COALESCE_MAX_WAIT_MS = args.coalesce_max_ms
+    bot.SEND_GLOBAL_RATE = args.send_rate
+    bot.CACHE_ENABLED = not args.no_cache
+    bot.SUMMARY_ENABLED = not args.no_summary
+    bot.DB_PATH = None if args.db == "none" else args.db
+    bot.HOT_USERS = args.hot_users
+    bot.COLD_STATE_FILE = f"{args.db}.cold" if bot.DB_PATH else None
+    bot.HEDGE_REQUESTS = args.hedge
+    bot.llm_client = LLMRouter(
+        [bot.create_llm_client({"name": name, "url": url, "key": "bench", "model": "mock"}) for name, url in llm_urls],
+        hedge=args.hedge,
+        hedge_min_delay=args.hedge_min_delay
+    )
+    return bot.BotHandlers()
+
+async def run(args):
+    rng = random.Random(args.seed)
+    llm_server = MockLLMServer(latency=args.latency, jitter=args.latency / 4, error_rate=args.error_rate)
+    await llm_server.start()
+    llm_urls = [("mock", llm_server.url)]
+    backup_server = None
+    if args.hedge:
+        # 第二个模拟端点，延迟不同，用来观察对冲
+        backup_server = MockLLMServer(latency=args.backup_latency, jitter=args.backup_latency / 4, error_rate=args.error_rate)
+        await backup_server.start()
+        llm_urls.append(("mock-backup", backup_server.url))
+    handlers = configure(args, llm_urls)
+    telegram = MockTelegramBot(latency=args.telegram_latency)
+    handlers.start(telegram)
+
+    started = time.monotonic()
+    try:
+        for i in range(args.messages):
+            # 按目标速率投递，落后时不补睡
+            delay = started + i / args.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            user_id = 100000 + rng.randrange(args.users)
+            telegram.expect(user_id)
+            await handlers.handle_message(make_update(i + 1, user_id, synthetic_text(rng, args.opener_ratio)), None)
+        sent_at = time.monotonic()
+
+        deadline = sent_at + args.drain_timeout
+        while telegram.pending > handlers.scheduler.shed_count and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        finished = time.monotonic()
+        cold_users = handlers.memory.users.cold_count  # close会删掉溢出文件
+    finally:
+        await handlers.close()
+        await bot.llm_client.close()
+        await llm_server.stop()
+        if backup_server:
+            await backup_server.stop()
+
+    latencies = telegram.reply_latencies
+    elapsed = finished - started
+    cache = handlers.cache.stats() if handlers.cache is not None else None
+    print("=== 压测结果 ===")
+    print(f"投递消息: {args.messages} | 用户: {args.users} | 目标速率: {args.rate}/s | 投递耗时: {sent_at - started:.1f}s")
+    print(f"已回复: {len(latencies)} | 合并: {handlers.scheduler.merged_count} | 丢弃: {handlers.scheduler.shed_count} | 未完成: {telegram.pending}")
+    print(f"吞吐: {len(latencies) / elapsed:.1f} 条/s (总耗时 {elapsed:.1f}s)")
+    print(f"回复延迟: p50 {percentile(latencies, 50) * 1000:.0f}ms | p95 {percentile(latencies, 95) * 1000:.0f}ms | p99 {percentile(latencies, 99) * 1000:.0f}ms")
+    print(f"排队等待: {handlers.latency_summary(handlers.queue_wait)} | 上游延迟: {handlers.latency_summary(handlers.llm_latency)}")
+    print(f"上游调用: {llm_server.calls} (流式 {llm_server.stream_calls}, 错误 {llm_server.errors}, 最大并发 {llm_server.max_in_flight})")
+    if backup_server:
+        print(f"备用端点调用: {backup_server.calls} | 对冲 {bot.llm_client.hedge_count} 次，备用胜出 {bot.llm_client.hedge_wins} 次")
+    if cache:
+        print(f"回复缓存: 命中 {cache['hits']} / 未命中 {cache['misses']}")
+    print(f"出站调用: {dict(telegram.calls)} | 限流重排 {handlers.sender.retry_after_count}")
+    users = handlers.memory.users
+    print(f"用户状态: 内存{len(users)} / 已换出{cold_users} | 换出{users.evicted_count}次 / 换入{users.loaded_count}次")
+    # Linux上ru_maxrss单位是KB
+    print(f"内存峰值: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="离线压测：模拟LLM和Telegram，回放合成消息")
+    parser.add_argument("--users", type=int, default=200, help="模拟用户数")
+    parser.add_argument("--messages", type=int, default=2000, help="总消息数")
+    parser.add_argument("--rate", type=float, default=50, help="目标投递速率（条/秒）")
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟LLM平均延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟LLM错误率")
+    parser.add_argument("--stream", action="store_true", help="使用流式回复")
+    parser.add_argument("--hedge", action="store_true", help="再起一个模拟端点并开启对冲请求（流式回复不对冲）")
+    parser.add_argument("--backup-latency", type=float, default=0.6, help="第二个模拟端点的平均延迟（秒）")
+    parser.add_argument("--hedge-min-delay", type=float, default=0.1, help="对冲前至少等待的秒数")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="模拟Telegram接口延迟（秒）")
+    parser.add_argument("--typing-delay", type=float, default=0.0, help="覆盖TYPING_DELAY")
+    parser.add_argument("--max-in-flight", type=int, default=bot.MAX_IN_FLIGHT)
+    parser.add_argument("--coalesce-ms", type=int, default=bot.COALESCE_WINDOW_MS)
+    parser.add_argument("--coalesce-max-ms", type=int, default=bot.COALESCE_MAX_WAIT_MS)
+    parser.add_argument("--send-rate", type=float, default=bot.SEND_GLOBAL_RATE, help="出站全局限速（条/秒）")
+    parser.add_argument("--opener-ratio", type=float, default=0.2, help="高频开场白占比（走回复缓存）")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--no-summary", action="store_true")
+    parser.add_argument("--db", default=None, help="数据库路径，默认临时文件，none表示只用内存")
+    parser.add_argument("--hot-users", type=int, default=bot.HOT_USERS, help="内存里最多保留的用户数，其余换出到磁盘")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="投递完后最多等待回复的秒数")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger().setLevel(logging.WARNING)  # 逐条消息的INFO日志会拖慢压测
+    tmp_dir = None
+    if args.db is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        args.db = os.path.join(tmp_dir.name, "bench.db")
+    try:
+        asyncio.run(run(args))
+    finally:
+        if tmp_dir:
+            tmp_dir.cleanup()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,38 @@
 import asyncio
+import os
 import random
 import logging
-import aiohttp
+import signal
+import time
 import pytz
 from datetime import datetime
+from pathlib import Path
+from cache import ResponseCache
+from budget import MESSAGE_OVERHEAD, build_context, estimate_tokens
+from history import HistoryRing, Message
+from auth import AuthSystem
+from config import ROLE, SETTINGS
+from core import AICore
+from export import export_filename, export_to_file, parse_export_args
+from metrics import MetricsServer, Registry
+from logs import setup_logging
+from llm import CircuitBreaker, CircuitOpenError, LLMClient, LLMError, LLMRouter, PaymentRequired
+from proactive import ProactiveScheduler
+from prompt import PromptBuilder
+from scheduler import ChatScheduler
+from sender import PRIORITY_ADMIN, PRIORITY_BACKGROUND, PRIORITY_REPLY, SendScheduler
+from storage import SQLiteStore
+from summarizer import Summarizer
+from userstate import ColdStore, TieredUsers
+from webhook import WebhookServer
 from telegram import Update
+from telegram.error import NetworkError, RetryAfter
 from telegram.ext import (
-    Updater,
+    Application,
     CommandHandler,
     MessageHandler,
-    Filters,
-    CallbackContext
+    filters,
+    ContextTypes
 )
 
 # ========== 核心配置 ==========
@@ -19,244 +41,810 @@ ADMINS = ["admin telegram ID"]  # 替换为你的TG用户ID
 TARGET_USER_ID = "Your telegram ID"
 TARGET_RELATION = "The relationship between bot and you"
 KEEP_ALIVE_INTERVAL = 60  # 1分钟保活
+TIMEZONE = "Asia/Shanghai"  # 免打扰时段、导出日期按这个时区
 TYPING_DELAY = 0.5  # 真人秒回延迟
 CONTEXT_LENGTH = 10  # 上下文记忆长度
+DB_PATH = "chat.db"  # 聊天记录数据库，设为None则只保存在内存
+HOT_USERS = 1000  # 内存里最多保留多少个用户的状态，超出后按最近活跃时间换出最久没说话的
+HOT_IDLE_SECONDS = 6 * 3600  # 沉默超过这么久的用户即使没超出上限也换出
+COLD_STATE_FILE = "users.cold"  # 换出用户的marshal溢出文件（启动时清空），设为None则直接丢弃、下次从数据库加载
+MAX_CONCURRENT_UPDATES = 256  # 同时处理的更新数上限（共享事件循环）
+MAX_IN_FLIGHT = 64  # 同时等待AI回复的对话数上限
+CHAT_QUEUE_SIZE = 3  # 单个用户最多排队消息数，超出后合并进最后一条
+MAX_QUEUED = 2000  # 全局排队上限，超出直接丢弃
+COALESCE_WINDOW_MS = 1200  # 连发消息间隔小于该值（毫秒）时合并成一轮对话
+COALESCE_MAX_WAIT_MS = 3000  # 从第一条算起最多合并多久（毫秒），一直连发也不会迟迟不回
+
+# 出站限速（Telegram约30条/秒全局、1条/秒单聊天）
+SEND_GLOBAL_RATE = 30
+SEND_CHAT_RATE = 1.0
+SEND_CHAT_BURST = 3  # 单聊天允许的短时突发条数
+SEND_MAX_ATTEMPTS = 3  # 被限流或网络错误时最多尝试次数
+
+# 日志：后台线程写JSON行，按大小或时间轮转并gzip压缩旧文件
+LOG_FILE = "chat.log"
+LOG_MAX_BYTES = 5 * 1024 * 1024  # 单个日志文件上限
+LOG_BACKUP_COUNT = 5  # 保留几个压缩的旧日志
+LOG_ROTATE_INTERVAL = 24 * 3600  # 最长多久轮转一次（秒）
+LOG_SAMPLE_RATE = 1.0  # 逐条消息日志的采样比例，存储慢时可调低（警告和错误不采样）
+
+# 指标：本地 /metrics 接口（Prometheus文本格式），设为None则不监听
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 9108
+
+# 分片模式（python3 shard.py）：按用户ID一致性哈希分给多个工作进程
+SHARD_WORKERS = 2
+SHARD_VNODES = 100  # 每个工作进程在哈希环上的虚拟节点数，越多分布越均匀
+
+# 接收更新方式："polling" 长轮询，"webhook" 内嵌服务器接收推送
+UPDATE_MODE = "polling"
+WEBHOOK_URL = "https://your.domain"  # 反向代理后的公网地址，设为None则不自动注册webhook
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8443
+WEBHOOK_SECRET = "change-this-secret"  # 只能包含 A-Z a-z 0-9 _ -
 
 # 网络配置
 AI_API_TIMEOUT = 20
 RETRY_TIMES = 3
+RETRY_BACKOFF_BASE = 0.5  # 指数退避起始等待（秒），带随机抖动
+RETRY_BACKOFF_MAX = 8  # 单次退避最长等待（秒）
+HTTP_POOL_LIMIT = 100  # 连接池总连接数
+HTTP_POOL_LIMIT_PER_HOST = 32  # 单个上游主机的连接数
+HTTP_KEEPALIVE_TIMEOUT = 60  # 空闲长连接保持时间（秒）
+DNS_CACHE_TTL = 300  # DNS缓存时间（秒）
+BREAKER_FAILURES = 5  # 连续失败多少次后熔断
+BREAKER_RESET_TIMEOUT = 30  # 熔断后多久放一个探测请求（秒）
+
+# 流式回复配置
+STREAM_REPLY = True  # 边生成边显示回复
+STREAM_FIRST_CHARS = 6  # 攒够多少字就先发出第一条消息
+STREAM_EDIT_INTERVAL = 1.0  # 两次编辑消息的最小间隔（秒）
 
 # AI API 配置
 DEEPSEEK_API_KEY = "ai api key"
 DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 DEEPSEEK_MODEL = "deepseek-chat"
 
+# 多个OpenAI兼容端点，按实时延迟自动选最快的健康端点；只填一个就是单端点
+LLM_ENDPOINTS = [
+    {"name": "deepseek", "url": DEEPSEEK_API_URL, "key": DEEPSEEK_API_KEY, "model": DEEPSEEK_MODEL},
+]
+LATENCY_WINDOW = 200  # 每个端点保留最近多少次请求的延迟
+HEDGE_REQUESTS = False  # 超过p95延迟还没返回时，向第二快的端点再发一次
+HEDGE_MIN_DELAY = 2.0  # 对冲前至少等待的秒数
+MODEL_TOKEN_LIMIT = 65536  # 模型上下文窗口（token）
+MAX_TOKENS = 100  # 单次回复最多生成的token
+PROMPT_TOKEN_BUDGET = 3000  # 提示词token上限，控制请求大小和延迟
+
+# 回复缓存配置（陌生人开场白等高频短消息）
+CACHE_ENABLED = True
+CACHE_SIZE = 2000  # 最多缓存多少个不同的问法
+CACHE_TTL = 6 * 3600  # 缓存有效期（秒）
+CACHE_POOL_SIZE = 4  # 每个问法攒几条不同回复，命中时随机挑
+CACHE_MAX_MESSAGE_CHARS = 12  # 只缓存这么短的消息
+CACHE_MAX_CONTEXT = 2  # 只缓存上下文不超过这么多条的对话（开场阶段）
+
+# 滚动摘要配置（旧对话压缩成摘要，代替更长的原始历史）
+SUMMARY_ENABLED = True
+SUMMARY_TRIGGER = 6  # 挤出上下文的消息攒够多少条就生成摘要
+SUMMARY_BATCH = 4  # 每批最多为几个用户生成摘要
+SUMMARY_INTERVAL = 10  # 后台摘要检查间隔（秒）
+SUMMARY_MAX_TOKENS = 200
+
+# 主动消息配置（开关见 config.SETTINGS["active"]，运行中用 //active on/off 切换）
+PROACTIVE_INTERVALS = {  # 对方沉默多久后主动找（秒），不在表里的关系不主动
+    "love": 4 * 3600,
+    "close": 8 * 3600,
+    "family": 12 * 3600,
+    "friend": 24 * 3600
+}
+PROACTIVE_QUIET_HOURS = (23, 8)  # 免打扰时段（本地小时，开始, 结束）
+PROACTIVE_JITTER = 0.2  # 间隔随机浮动比例，避免同一时刻集中发送
+PROACTIVE_BATCH = 20  # 每秒最多发起几条主动消息
+PROACTIVE_PROMPT = "现在换你主动找对方聊天：接着之前聊过的内容或者分享一件自己的小事，一两句话，自然一点，不要说“在吗”。"
+PROACTIVE_FALLBACKS = ["在干嘛呢～", "突然想起你了～", "今天过得怎么样呀"]
+
 RELATION_TYPES = ["love", "friend", "close", "family", "stranger"]
+PAYMENT_FALLBACKS = ["哎呀我这边有点小问题～", "稍等一下下～"]
+NETWORK_FALLBACKS = ["网络有点卡～", "没听清呢，再说一遍好不好～"]
+FALLBACK_REPLIES = set(PAYMENT_FALLBACKS + NETWORK_FALLBACKS)
 RELATION_CMD_PROMPT = f"用法: /set_relation <用户ID> <关系> | 支持: {','.join(RELATION_TYPES)}"
 
 # ========== 日志配置（后台显示用户+回复） ==========
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    handlers=[
-        logging.FileHandler("chat.log", encoding="utf-8"),
-        logging.StreamHandler()
-    ]
+# 回复路径上只把日志记录放进队列，格式化和写盘都在后台线程
+log_listener = setup_logging(
+    LOG_FILE,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    rotate_interval=LOG_ROTATE_INTERVAL,
+    sample_rate=LOG_SAMPLE_RATE
 )
 logger = logging.getLogger(__name__)
 
 # ========== 上下文记忆管理 ==========
 class MemorySystem:
-    def __init__(self):
-        self.users = {}
+    def __init__(self, store=None, cold_path=None):
+        self.store = store
+        self.on_evict = None  # on_evict(user_id, 待摘要条数)，旧消息挤出窗口时回调
+        self.is_busy = None  # is_busy(user_id)，正在处理消息的用户不换出
+        # 热用户在内存LRU里，长尾的一次性用户按最近活跃时间换出到磁盘，下次来消息再读回
+        self.users = TieredUsers(
+            self._dump_user,
+            self._load_user,
+            ColdStore(cold_path) if cold_path else None,
+            max_hot=HOT_USERS,
+            idle_after=HOT_IDLE_SECONDS,
+            pinned=self._pinned
+        )
         self.users[TARGET_USER_ID] = {
             "relationship": TARGET_RELATION,
-            "chat_history": [],
-            "locked": True
+            "chat_history": self._load_history(TARGET_USER_ID),
+            "locked": True,
+            "summary": self.store.get_summary(TARGET_USER_ID) if self.store else None,
+            "evicted": [],
+            "last_active": self._load_last_active(TARGET_USER_ID)
+        }
+        if self.store:
+            self.store.set_relationship(TARGET_USER_ID, TARGET_RELATION, locked=True)
+
+    def _load_history(self, user_id):
+        """创建上下文环形缓冲，并从数据库恢复最近的上下文"""
+        # 多留一格：读取上下文视图后再写入当前这句，不会覆盖视图里的内容
+        history = HistoryRing(CONTEXT_LENGTH + 1)
+        if self.store:
+            for role, content, ts in self.store.get_recent(user_id, CONTEXT_LENGTH):
+                history.append(Message(role, content, ts))
+        return history
+
+    def _load_last_active(self, user_id):
+        stats = self.store.get_user_stats(user_id) if self.store else None
+        return stats[1] if stats else 0
+
+    @staticmethod
+    def _dump_user(user_data):
+        """换出：转成只含内置类型的元组，字段顺序见_load_user"""
+        return (
+            user_data["relationship"],
+            user_data["locked"],
+            user_data["summary"],
+            user_data["last_active"],
+            [(msg.role, msg.content, msg.ts) for msg in user_data["chat_history"]],
+            [(msg.role, msg.content, msg.ts) for msg in user_data["evicted"]]
+        )
+
+    @staticmethod
+    def _load_user(record):
+        relationship, locked, summary, last_active, history, evicted = record
+        return {
+            "relationship": relationship,
+            "chat_history": HistoryRing(CONTEXT_LENGTH + 1, (Message(*msg) for msg in history)),
+            "locked": locked,
+            "summary": summary,
+            "evicted": [Message(*msg) for msg in evicted],
+            "last_active": last_active
         }
 
+    def _pinned(self, user_id, user_data):
+        return user_id == TARGET_USER_ID or bool(self.is_busy and self.is_busy(user_id))
+
+    def has_user(self, user_id):
+        """内存、溢出文件或数据库里有这个用户"""
+        return user_id in self.users or bool(self.store and self.store.has_user(user_id))
+
+    def last_active(self, user_id):
+        """读最近活跃时间，不把冷用户换回内存"""
+        user_data = self.users.hot.get(user_id)
+        if user_data is not None:
+            return user_data["last_active"]
+        record = self.users.cold.get(user_id) if self.users.cold is not None else None
+        return record[3] if record else self._load_last_active(user_id)
+
     def get_user(self, user_id):
-        if user_id not in self.users:
-            self.users[user_id] = {
+        user_data = self.users.get(user_id)
+        if user_data is None:
+            user_data = {
                 "relationship": "stranger",
-                "chat_history": [],
-                "locked": False
+                "chat_history": self._load_history(user_id),
+                "locked": False,
+                "summary": self.store.get_summary(user_id) if self.store else None,
+                "evicted": [],
+                "last_active": self._load_last_active(user_id)
             }
-        return self.users[user_id]
+            saved = self.store.get_relationship(user_id) if self.store else None
+            if saved:
+                user_data["relationship"], user_data["locked"] = saved
+            self.users[user_id] = user_data
+        return user_data
 
     def update_relationship(self, user_id, rel_type):
-        user_data = self.get_user(user_id)
-        if user_data["locked"] or rel_type not in RELATION_TYPES:
+        """修改关系；冷用户直接改溢出记录，只在数据库里的用户只写数据库，都不换入内存"""
+        if rel_type not in RELATION_TYPES:
             return False
-        user_data["relationship"] = rel_type
+        user_data = self.users.hot.get(user_id)
+        record = self.users.cold.get(user_id) if user_data is None and self.users.cold is not None else None
+        if user_data is not None:
+            if user_data["locked"]:
+                return False
+            user_data["relationship"] = rel_type
+        elif record is not None:
+            if record[1]:
+                return False
+            self.users.cold.put(user_id, (rel_type,) + tuple(record[1:]))
+        else:
+            saved = self.store.get_relationship(user_id) if self.store else None
+            if not self.store or (saved and saved[1]):
+                return False
+        if self.store:
+            self.store.set_relationship(user_id, rel_type)
         return True
 
     def add_chat_history(self, user_id, role, content):
         user_data = self.get_user(user_id)
-        user_data["chat_history"].append({"role": role, "content": content})
-        if len(user_data["chat_history"]) > CONTEXT_LENGTH:
-            user_data["chat_history"] = user_data["chat_history"][-CONTEXT_LENGTH:]
+        msg = Message(role, content)
+        evicted = user_data["chat_history"].append(msg)
+        if role == "user":
+            user_data["last_active"] = msg.ts
+            self.users.touch(user_id, msg.ts)
+        if self.store:
+            self.store.add_message(user_id, msg.role, content, msg.ts)
+        if evicted is not None and self.on_evict:
+            user_data["evicted"].append(evicted)
+            self.on_evict(user_id, len(user_data["evicted"]))
 
     def get_context(self, user_id):
         user_data = self.get_user(user_id)
-        return user_data["chat_history"].copy()
+        return user_data["chat_history"].view(CONTEXT_LENGTH)
+
+    def take_evicted(self, user_id):
+        """取走待摘要的旧消息"""
+        user_data = self.get_user(user_id)
+        evicted, user_data["evicted"] = user_data["evicted"], []
+        return evicted
+
+    def restore_evicted(self, user_id, turns):
+        """摘要失败时放回旧消息，最多保留几批，避免无限增长"""
+        user_data = self.get_user(user_id)
+        user_data["evicted"] = (turns + user_data["evicted"])[-SUMMARY_TRIGGER * 4:]
+
+    def get_summary(self, user_id):
+        return self.get_user(user_id)["summary"]
+
+    def set_summary(self, user_id, summary):
+        self.get_user(user_id)["summary"] = summary
+        if self.store:
+            self.store.set_summary(user_id, summary)
 
 # ========== AI 核心调用（专注主回复+上下文连贯） ==========
-async def call_ai_api(user_msg, user_relation, context):
-    role_prompts = {
-        "love": """你和对象线上聊天，语气亲昵撒娇，像真人唠嗑一样自然。
-        一定要参考之前的聊天历史，记住对方说过的话，回复要接得上上一句的话题。
-        回复很短，一两句就够，绝对不要括号动作（比如笑、抱抱），内容不重复。""",
-        "friend": """你和好朋友线上聊天，语气随意接地气，会接梗吐槽带口头禅。
-        参考之前的聊天内容，别跑偏，回复简短自然，不啰嗦。""",
-        "stranger": """你和刚认识的人线上聊天，礼貌温和不尴尬，会找小话题但不查户口。
-        记住对方说过的基本信息，回复简短，慢慢拉近距离。"""
-    }
-    system_prompt = role_prompts.get(user_relation, role_prompts["stranger"])
+# 人设状态（//命令修改）和编译好的系统提示词，提示词只在人设变化时重建
+ai_core = AICore(ROLE, SETTINGS)
+prompt_builder = PromptBuilder(ai_core)
+auth = AuthSystem(ADMINS)
 
+def build_messages(user_msg, user_relation, context, summary=None):
+    system_prompt, prompt_tokens = prompt_builder.get(user_relation)
+
+    # 按token预算挑选历史窗口，而不是固定条数
+    budget = min(PROMPT_TOKEN_BUDGET, MODEL_TOKEN_LIMIT - MAX_TOKENS)
+    budget -= prompt_tokens + estimate_tokens(user_msg) + 2 * MESSAGE_OVERHEAD
     messages = [{"role": "system", "content": system_prompt}]
-    messages.extend(context)
+    messages.extend(build_context(context, budget, summary))
     messages.append({"role": "user", "content": user_msg})
+    return messages
 
-    for retry in range(RETRY_TIMES):
-        try:
-            session = await get_aiohttp_session()
-            headers = {
-                "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            data = {
-                "model": DEEPSEEK_MODEL,
-                "messages": messages,
-                "temperature": 1.0,  # 真人化随机性
-                "max_tokens": 100,
-                "stream": False
-            }
-            async with session.post(DEEPSEEK_API_URL, headers=headers, json=data) as resp:
-                if resp.status == 200:
-                    result = await resp.json()
-                    return result["choices"][0]["message"]["content"].strip()
-                elif resp.status == 402:
-                    return random.choice(["哎呀我这边有点小问题～", "稍等一下下～"])
-                else:
-                    continue
-        except Exception:
-            if retry < RETRY_TIMES - 1:
-                await asyncio.sleep(0.8)
-            else:
-                return random.choice(["网络有点卡～", "没听清呢，再说一遍好不好～"])
-
-# ========== 异步会话管理 ==========
-async def get_aiohttp_session():
-    if not hasattr(get_aiohttp_session, "session"):
-        timeout = aiohttp.ClientTimeout(total=AI_API_TIMEOUT)
-        get_aiohttp_session.session = aiohttp.ClientSession(timeout=timeout)
-    return get_aiohttp_session.session
-
-async def close_aiohttp_session():
-    if hasattr(get_aiohttp_session, "session"):
-        await get_aiohttp_session.session.close()
+async def call_ai_api(user_msg, user_relation, context, summary=None):
+    messages = build_messages(user_msg, user_relation, context, summary)
+    try:
+        return await llm_client.complete(messages, max_tokens=MAX_TOKENS, temperature=1.0)  # 真人化随机性
+    except PaymentRequired:
+        return random.choice(PAYMENT_FALLBACKS)
+    except CircuitOpenError:
+        # 上游故障期间直接给兜底回复，不让用户干等
+        return random.choice(NETWORK_FALLBACKS)
+    except LLMError as e:
+        logger.warning(f"AI请求失败: {str(e)}")
+        return random.choice(NETWORK_FALLBACKS)
+
+async def call_summary_api(messages):
+    """低优先级的摘要请求，只试一次，失败抛异常由摘要任务处理"""
+    return await llm_client.complete(messages, max_tokens=SUMMARY_MAX_TOKENS, temperature=0.3, retries=1)
+
+async def call_checkin_api(user_relation, context, summary=None):
+    """生成一条主动消息，失败时用兜底开场"""
+    messages = build_messages(PROACTIVE_PROMPT, user_relation, context, summary)
+    messages[-1]["role"] = "system"
+    try:
+        return await llm_client.complete(messages, max_tokens=MAX_TOKENS, temperature=1.0, retries=1)
+    except LLMError as e:
+        logger.warning(f"主动消息生成失败: {str(e)}")
+        return random.choice(PROACTIVE_FALLBACKS)
+
+def stream_ai_api(user_msg, user_relation, context, summary=None):
+    """流式调用：逐块产出回复文本"""
+    messages = build_messages(user_msg, user_relation, context, summary)
+    return llm_client.stream(messages, max_tokens=MAX_TOKENS, temperature=1.0)
+
+# ========== 上游客户端（连接池+退避重试+熔断+多端点路由） ==========
+def create_llm_client(endpoint):
+    return LLMClient(
+        endpoint["url"],
+        endpoint["key"],
+        endpoint["model"],
+        timeout=AI_API_TIMEOUT,
+        retries=RETRY_TIMES,
+        backoff_base=RETRY_BACKOFF_BASE,
+        backoff_max=RETRY_BACKOFF_MAX,
+        pool_limit=HTTP_POOL_LIMIT,
+        pool_limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        dns_ttl=DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        breaker=CircuitBreaker(BREAKER_FAILURES, BREAKER_RESET_TIMEOUT),
+        name=endpoint.get("name")
+    )
+
+llm_client = LLMRouter(
+    [create_llm_client(endpoint) for endpoint in LLM_ENDPOINTS],
+    window=LATENCY_WINDOW,
+    hedge=HEDGE_REQUESTS,
+    hedge_min_delay=HEDGE_MIN_DELAY
+)
 
 # ========== 消息处理器（移除追加回复，专注一对一聊天） ==========
+def merge_messages(older, newer):
+    """把连发或排队溢出的新消息并入上一条，回复最新那条消息，延迟从最早那条算起"""
+    return newer[0], f"{older[1]}\n{newer[1]}", older[2]
+
 class BotHandlers:
     def __init__(self):
-        self.memory = MemorySystem()
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
+        self.memory = MemorySystem(SQLiteStore(DB_PATH) if DB_PATH else None, COLD_STATE_FILE)
+        # 每个用户一条有序队列，全局限制同时在途的AI请求
+        self.scheduler = ChatScheduler(
+            self.process_message,
+            max_in_flight=MAX_IN_FLIGHT,
+            max_pending=CHAT_QUEUE_SIZE,
+            max_queued=MAX_QUEUED,
+            merge=merge_messages,
+            debounce=COALESCE_WINDOW_MS / 1000,
+            max_wait=COALESCE_MAX_WAIT_MS / 1000
+        )
+        self.sender = SendScheduler(SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_ATTEMPTS)
+        self.cache = ResponseCache(CACHE_SIZE, CACHE_TTL, CACHE_POOL_SIZE) if CACHE_ENABLED else None
+        self.summarizer = None
+        if SUMMARY_ENABLED:
+            # 实时回复占用过半并发名额时，摘要让路
+            self.summarizer = Summarizer(
+                self.memory,
+                call_summary_api,
+                threshold=SUMMARY_TRIGGER,
+                batch_size=SUMMARY_BATCH,
+                interval=SUMMARY_INTERVAL,
+                is_busy=lambda: self.scheduler.in_flight >= MAX_IN_FLIGHT // 2
+            )
+            self.memory.on_evict = self.summarizer.notify
+        self.proactive = ProactiveScheduler(
+            self.send_checkin,
+            is_enabled=lambda: ai_core.settings["active"],
+            intervals=PROACTIVE_INTERVALS,
+            quiet_hours=PROACTIVE_QUIET_HOURS,
+            timezone=pytz.timezone(TIMEZONE),
+            jitter=PROACTIVE_JITTER,
+            batch_size=PROACTIVE_BATCH
+        )
+        self.memory.is_busy = lambda user_id: user_id in self.scheduler.workers
+        # 处理中的用户不换出，处理完再按预算检查一次，连发高峰过后内存能降回来
+        self.scheduler.on_idle = lambda user_id: self.memory.users.evict()
+        self.owns = None  # 分片模式下判断用户是否归本进程处理，None表示全部
+        self.metrics = Registry()
+        self.register_metrics()
+
+    def register_metrics(self):
+        """热路径只对直方图observe一次，其余计数在抓取时直接读各模块已有的属性"""
+        registry = self.metrics
+        self.reply_latency = registry.histogram("tgbot_reply_latency_seconds", "收到消息到回复发出的时间")
+        self.queue_wait = registry.histogram("tgbot_queue_wait_seconds", "消息在用户队列里等待（含连发合并）的时间")
+        self.llm_latency = registry.histogram("tgbot_llm_latency_seconds", "上游LLM请求延迟（流式为首字延迟）")
+        llm_client.on_latency = lambda name, seconds: self.llm_latency.observe(seconds)
+        self.replies = registry.counter("tgbot_replies_total", "已回复的对话轮数")
+        registry.counter("tgbot_dropped_messages_total", "排队已满被丢弃的消息", func=lambda: self.scheduler.shed_count)
+        registry.counter("tgbot_merged_messages_total", "被合并进上一条的消息", func=lambda: self.scheduler.merged_count)
+        registry.counter("tgbot_llm_retries_total", "上游请求重试次数", func=lambda: sum(c.retry_count for c in llm_client.clients))
+        registry.counter("tgbot_llm_responses_total", "上游非200响应（402/429/5xx等）", label="status", func=self.upstream_statuses)
+        registry.counter("tgbot_llm_hedges_total", "对冲请求次数", func=lambda: llm_client.hedge_count)
+        registry.counter("tgbot_cache_hits_total", "回复缓存命中", func=lambda: self.cache.hits if self.cache is not None else 0)
+        registry.counter("tgbot_cache_misses_total", "回复缓存未命中", func=lambda: self.cache.misses if self.cache is not None else 0)
+        registry.counter("tgbot_sent_total", "出站发送成功次数", func=lambda: self.sender.sent_count)
+        registry.counter("tgbot_send_failed_total", "出站发送失败次数", func=lambda: self.sender.failed_count)
+        registry.counter("tgbot_send_retry_after_total", "出站被Telegram限流次数", func=lambda: self.sender.retry_after_count)
+        registry.gauge("tgbot_in_flight", "正在等待AI回复的对话数", func=lambda: self.scheduler.in_flight)
+        registry.gauge("tgbot_queued_messages", "排队中的消息数", func=lambda: self.scheduler.queued)
+        registry.gauge("tgbot_outbound_queue", "出站队列长度", func=lambda: self.sender.queued)
+        registry.gauge("tgbot_tracked_users", "内存里的用户数", func=lambda: len(self.memory.users))
+        registry.gauge("tgbot_cold_users", "换出到溢出文件的用户数", func=lambda: self.memory.users.cold_count)
+        registry.counter("tgbot_user_evictions_total", "用户状态换出次数", func=lambda: self.memory.users.evicted_count)
+        registry.counter("tgbot_user_loads_total", "冷用户换回内存次数", func=lambda: self.memory.users.loaded_count)
+        registry.gauge("tgbot_proactive_scheduled", "已安排主动消息的用户数", func=lambda: len(self.proactive.wheel))
 
-    def handle_message(self, update: Update, context: CallbackContext):
+    def upstream_statuses(self):
+        statuses = {}
+        for client in llm_client.clients:
+            for status, count in client.status_counts.items():
+                statuses[status] = statuses.get(status, 0) + count
+        return statuses
+
+    def start(self, bot):
+        self.sender.start(bot)
+        if self.summarizer:
+            self.summarizer.start()
+        self.schedule_proactive()
+        self.proactive.start()
+
+    def schedule_proactive(self):
+        """按数据库里的最近活跃时间恢复主动消息计划（分片模式只恢复自己的用户）"""
+        if not self.memory.store:
+            return
+        for user_id, last_active, relationship in self.memory.store.iter_user_activity():
+            if self.owns is None or self.owns(user_id):
+                self.proactive.touch(user_id, relationship, last_active)
+
+    def set_shard_count(self, count):
+        """分片模式下所有工作进程共用一个Bot令牌，全局限速和主动消息批量按进程数平分"""
+        self.sender.set_global_rate(SEND_GLOBAL_RATE / count)
+        self.proactive.batch_size = max(1, PROACTIVE_BATCH // count)
+
+    def rebalance(self):
+        """分片数变化后：释放转走的用户（状态都在数据库里），接手新分到的用户"""
+        for user_id in [uid for uid in self.memory.users if not self.owns(uid)]:
+            if user_id != TARGET_USER_ID and user_id not in self.scheduler.workers:
+                del self.memory.users[user_id]
+        for user_id in [uid for uid in self.proactive.wheel.index if not self.owns(uid)]:
+            self.proactive.forget(user_id)
+        self.schedule_proactive()
+
+    def reply(self, update: Update, text, priority=None):
+        """经出站调度发送回复，管理员优先"""
+        if priority is None:
+            priority = PRIORITY_ADMIN if str(update.effective_user.id) in ADMINS else PRIORITY_REPLY
+        return self.sender.send_message(update.effective_chat.id, text, priority)
+
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = str(update.effective_user.id)
         user_name = update.effective_user.username or "未知用户"
         user_msg = update.message.text.strip()
+        logger.info("用户[%s(%s)] | 发送: %s", user_id, user_name, user_msg,
+                    extra={"sample": True, "event": "message", "user_id": user_id})
+        if not self.scheduler.submit(user_id, (update, user_msg, time.monotonic())):
+            logger.warning(f"用户[{user_id}] | 排队已满，消息被丢弃")
+
+    async def process_message(self, user_id, item):
+        """在用户队列里按顺序处理一条（可能合并过的）消息"""
+        update, user_msg, received = item
+        self.queue_wait.observe(time.monotonic() - received)
+        user_name = update.effective_user.username or "未知用户"
         user_data = self.memory.get_user(user_id)
         user_relation = user_data["relationship"]
+        summary = user_data.get("summary")
+        # 上一轮回复已写入历史后才读取上下文
         chat_context = self.memory.get_context(user_id)
 
-        # 记录用户消息到上下文
+        # 记录用户消息到上下文，并顺延下一次主动问候
         self.memory.add_chat_history(user_id, "user", user_msg)
-        logger.info(f"用户[{user_id}({user_name})] | 发送: {user_msg}")
+        self.proactive.touch(user_id, user_relation, user_data["last_active"])
+        ai_core.update_energy(user_msg)
+
+        # 模拟真人打字（几秒内重复的输入状态会被合并）
+        self.sender.send_typing(update.effective_chat.id)
 
-        # 模拟真人打字
-        update.message.chat.send_action(action="typing")
-        self.loop.run_until_complete(asyncio.sleep(TYPING_DELAY))
+        # 高频开场白先查缓存
+        cache_key = self.cache_key(user_relation, chat_context, user_msg, summary)
+        cached = self.cache.get(cache_key) if cache_key else None
 
         # 生成主回复（无追加）
-        main_resp = self.loop.run_until_complete(call_ai_api(user_msg, user_relation, chat_context))
-        update.message.reply_text(main_resp)
-        
+        complete = True
+        if cached:
+            await asyncio.sleep(TYPING_DELAY)
+            main_resp = cached
+            await self.reply(update, main_resp)
+        elif STREAM_REPLY:
+            main_resp, complete = await self.reply_streaming(update, user_msg, user_relation, chat_context, summary)
+        else:
+            await asyncio.sleep(TYPING_DELAY)
+            main_resp = await call_ai_api(user_msg, user_relation, chat_context, summary)
+            await self.reply(update, main_resp)
+
+        if cache_key and not cached and complete and main_resp not in FALLBACK_REPLIES:
+            self.cache.put(cache_key, main_resp)
+
+        self.reply_latency.observe(time.monotonic() - received)
+        self.replies.inc()
+
         # 记录Bot回复到上下文
         self.memory.add_chat_history(user_id, "assistant", main_resp)
-        logger.info(f"用户[{user_id}({user_name})] | Bot回复: {main_resp}")
+        logger.info("用户[%s(%s)] | Bot回复: %s", user_id, user_name, main_resp,
+                    extra={"sample": True, "event": "reply", "user_id": user_id})
+
+    async def send_checkin(self, user_id):
+        """主动找用户聊天：按关系和上下文生成一句，低优先级发送
+
+        发完不再排下一次，等对方回复后由process_message重新安排。
+        """
+        if user_id in self.scheduler.workers:
+            # 正在聊着，不用主动
+            return
+        user_data = self.memory.get_user(user_id)
+        text = await call_checkin_api(user_data["relationship"], self.memory.get_context(user_id), user_data["summary"])
+        await self.sender.send_message(int(user_id), text, PRIORITY_BACKGROUND)
+        self.memory.add_chat_history(user_id, "assistant", text)
+        logger.info("用户[%s] | Bot主动: %s", user_id, text, extra={"sample": True, "event": "proactive", "user_id": user_id})
+
+    def cache_key(self, user_relation, chat_context, user_msg, summary):
+        """只有短消息、开场阶段、没有个人摘要的对话才走缓存"""
+        if (self.cache is None or summary or len(user_msg) > CACHE_MAX_MESSAGE_CHARS
+                or len(chat_context) > CACHE_MAX_CONTEXT):
+            return None
+        return ResponseCache.make_key(user_relation, chat_context, user_msg, prompt_builder.version)
+
+    async def reply_streaming(self, update: Update, user_msg, user_relation, chat_context, summary=None):
+        """流式回复：先发出首批文字，再按间隔批量编辑同一条消息
 
-    def handle_status(self, update: Update, context: CallbackContext):
+        返回(回复文本, 是否完整生成)。
+        """
+        loop = asyncio.get_running_loop()
+        parts = []
+        sent = None
+        shown = ""
+        last_edit = 0.0
+        complete = True
+        try:
+            async for delta in stream_ai_api(user_msg, user_relation, chat_context, summary):
+                parts.append(delta)
+                text = "".join(parts).strip()
+                if sent is None:
+                    if len(text) >= STREAM_FIRST_CHARS:
+                        sent = await self.reply(update, text)
+                        shown, last_edit = text, loop.time()
+                elif text != shown and loop.time() - last_edit >= STREAM_EDIT_INTERVAL:
+                    # 中间编辑不等待结果，未发出的编辑会被更新的文本替换
+                    self.sender.edit_message(sent.chat_id, sent.message_id, text)
+                    shown, last_edit = text, loop.time()
+        except Exception as e:
+            complete = False
+            logger.warning(f"流式回复中断: {str(e)}")
+
+        text = "".join(parts).strip()
+        if not text:
+            # 一个字都没收到，退回普通请求（带重试）
+            text = await call_ai_api(user_msg, user_relation, chat_context, summary)
+        if sent is None:
+            await self.reply(update, text)
+        elif text != shown:
+            await self.sender.edit_message(sent.chat_id, sent.message_id, text)
+        return text, complete
+
+    async def close(self):
+        await self.proactive.close()
+        await self.scheduler.close()
+        await self.sender.close()
+        if self.summarizer:
+            await self.summarizer.close()
+        self.memory.users.close()
+        if self.memory.store:
+            self.memory.store.close()
+
+    def cache_summary(self):
+        if self.cache is None:
+            return "关闭"
+        stats = self.cache.stats()
+        return f"{stats['size']}条 | 命中{stats['hits']}/未命中{stats['misses']} ({stats['hit_rate']:.0%})"
+
+    @staticmethod
+    def latency_summary(histogram):
+        if not histogram.count:
+            return "暂无"
+        return f"p50 {histogram.quantile(0.5):.2f}s / p95 {histogram.quantile(0.95):.2f}s"
+
+    async def handle_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = str(update.effective_user.id)
         if user_id not in ADMINS:
-            update.message.reply_text("你没有权限哦～")
+            await self.reply(update, "你没有权限哦～")
             return
         active_users = len(self.memory.users)
+        cold_users = self.memory.users.cold_count
+        stored = self.memory.store.count_messages() if self.memory.store else 0
+        upstream = "\n".join(f"│  {line}" for line in llm_client.describe().splitlines())
+        retries = sum(client.retry_count for client in llm_client.clients)
+        statuses = " ".join(f"{status}×{count}" for status, count in sorted(self.upstream_statuses().items())) or "无"
         resp = f"""🤖 聊天Bot状态
-├─ 活跃用户数: {active_users}
+├─ 活跃用户数: {active_users} | 已换出{cold_users}人
+├─ 已存消息数: {stored}
+├─ 回复缓存: {self.cache_summary()}
+├─ 上游状态:
+{upstream}
+├─ 回复延迟: {self.latency_summary(self.reply_latency)} | 排队 {self.latency_summary(self.queue_wait)}
+├─ 上游延迟: {self.latency_summary(self.llm_latency)} | 重试{retries}次 | 异常响应 {statuses}
+├─ 处理中: {self.scheduler.in_flight} | 排队{self.scheduler.queued}条 | 丢弃{self.scheduler.shed_count}条
+├─ 出站队列: {self.sender.queued}条 | 已发{self.sender.sent_count} | 限流{self.sender.retry_after_count}次
+├─ 主动消息: {"开启" if ai_core.settings["active"] else "关闭"} | 待发{len(self.proactive.wheel)}人 | 已发{self.proactive.sent_count}条
 ├─ 保活间隔: {KEEP_ALIVE_INTERVAL}秒
 ├─ 上下文记忆长度: {CONTEXT_LENGTH}条
 └─ 锁定情侣用户: {TARGET_USER_ID}"""
-        update.message.reply_text(resp)
+        await self.reply(update, resp)
         logger.info(f"管理员[{user_id}] | 查看状态")
 
-    def handle_set_relation(self, update: Update, context: CallbackContext):
+    async def handle_system_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """//命令：管理员调整人设和开关，状态防抖后异步写盘"""
+        user_id = str(update.effective_user.id)
+        text = update.message.text.strip()
+        if not auth.verify_command(text, user_id):
+            await self.reply(update, "你没有权限哦～")
+            return
+        ok, resp = ai_core.process_command(text[2:])
+        await self.reply(update, resp if ok else f"❌ {resp}")
+        logger.info(f"管理员[{user_id}] | 系统命令: {text} | {'成功' if ok else '失败'}")
+
+    async def handle_set_relation(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = str(update.effective_user.id)
         if user_id not in ADMINS:
-            update.message.reply_text("你没有权限哦～")
+            await self.reply(update, "你没有权限哦～")
             return
         if len(context.args) != 2:
-            update.message.reply_text(RELATION_CMD_PROMPT)
+            await self.reply(update, RELATION_CMD_PROMPT)
             return
         target_uid, rel_type = context.args[0], context.args[1]
+        if not self.memory.has_user(target_uid):
+            await self.reply(update, f"❌ 没有用户[{target_uid}]的聊天记录")
+            return
         if self.memory.update_relationship(target_uid, rel_type):
-            update.message.reply_text(f"✅ 已将用户[{target_uid}]设为{rel_type}关系")
+            last_active = self.memory.last_active(target_uid)
+            # 分片模式下只有目标用户所在的分片安排主动消息，避免重复问候
+            if last_active and (self.owns is None or self.owns(target_uid)):
+                self.proactive.touch(target_uid, rel_type, last_active)
+            await self.reply(update, f"✅ 已将用户[{target_uid}]设为{rel_type}关系")
         else:
-            update.message.reply_text(f"❌ 设置失败（用户锁定或关系无效）")
+            await self.reply(update, f"❌ 设置失败（用户锁定或关系无效）")
+
+    async def handle_export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """分页读取数据库流式写入临时文件（可gzip/JSONL/CSV），再作为文件发给管理员"""
+        user_id = str(update.effective_user.id)
+        if user_id not in ADMINS:
+            await self.reply(update, "你没有权限导出聊天记录哦～")
+            return
+        tz = pytz.timezone(TIMEZONE)
+        try:
+            target_uid, options = parse_export_args(context.args, tz)
+        except ValueError as e:
+            await self.reply(update, str(e))
+            return
+        store = self.memory.store
+        if not store:
+            await self.reply(update, "未启用数据库（DB_PATH），无法导出～")
+            return
+        if not store.has_user(target_uid):
+            await self.reply(update, f"用户[{target_uid}]不存在～")
+            return
+
+        # 读库、压缩都在线程池里做，不阻塞其他用户的回复
+        loop = asyncio.get_running_loop()
+        path, count = await loop.run_in_executor(None, export_to_file, store.db_path, target_uid, options, tz)
+        try:
+            if not count:
+                await self.reply(update, f"用户[{target_uid}]暂无聊天记录～")
+                return
+            # 传路径而不是文件对象，发送失败重试时会重新读取文件
+            await self.sender.send_document(
+                update.effective_chat.id,
+                Path(path),
+                filename=export_filename(target_uid, options),
+                caption=f"✅ 用户[{target_uid}]聊天记录，共{count}条"
+            )
+        finally:
+            os.unlink(path)
+        logger.info(f"管理员[{user_id}] | 导出用户[{target_uid}]聊天记录 {count}条")
 
-    def error_handler(self, update: Update, context: CallbackContext):
+    async def error_handler(self, update: object, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"系统错误: {str(context.error)}")
-        if update:
-            update.message.reply_text("哎呀，出了点小问题～")
-
-# ========== 聊天记录导出功能 ==========
-def export_chat_history(update: Update, context: CallbackContext):
-    user_id = str(update.effective_user.id)
-    if user_id not in ADMINS:
-        update.message.reply_text("你没有权限导出聊天记录哦～")
-        return
-    if len(context.args) != 1:
-        update.message.reply_text("用法: /export <目标用户ID>")
-        return
-    target_uid = context.args[0]
-    memory = BotHandlers().memory
-    if target_uid not in memory.users:
-        update.message.reply_text(f"用户[{target_uid}]不存在～")
-        return
-    chat_history = memory.get_context(target_uid)
-    if not chat_history:
-        update.message.reply_text(f"用户[{target_uid}]暂无聊天记录～")
-        return
-    export_content = f"=== 用户[{target_uid}]聊天记录 ===\n"
-    for msg in chat_history:
-        role = "用户" if msg["role"] == "user" else "Bot"
-        export_content += f"{role}: {msg['content']}\n"
-    export_content += "=== 导出结束 ==="
-    with open(f"chat_export_{target_uid}.txt", "w", encoding="utf-8") as f:
-        f.write(export_content)
-    update.message.reply_text(f"✅ 聊天记录已导出到: chat_export_{target_uid}.txt")
-    logger.info(f"管理员[{user_id}] | 导出用户[{target_uid}]聊天记录")
+        # 被限流或网络故障时再发一条只会更糟
+        if isinstance(context.error, (RetryAfter, NetworkError)):
+            return
+        if isinstance(update, Update) and update.effective_chat:
+            self.reply(update, "哎呀，出了点小问题～")
 
 # ========== 启动Bot ==========
-def main():
+async def keep_alive():
+    # 1分钟保活任务
+    while True:
+        logger.info("保活任务 | Bot正常运行中")
+        await asyncio.sleep(KEEP_ALIVE_INTERVAL)
+
+async def post_init(application: Application):
+    application.bot_data["keep_alive"] = asyncio.create_task(keep_alive())
+    handlers = application.bot_data.get("handlers")
+    if handlers:
+        handlers.start(application.bot)
+        if METRICS_PORT:
+            server = MetricsServer(handlers.metrics, METRICS_LISTEN, METRICS_PORT)
+            await server.start()
+            application.bot_data["metrics_server"] = server
+
+async def post_shutdown(application: Application):
+    task = application.bot_data.pop("keep_alive", None)
+    if task:
+        task.cancel()
+    server = application.bot_data.pop("metrics_server", None)
+    if server:
+        await server.stop()
+    handlers = application.bot_data.get("handlers")
+    if handlers:
+        await handlers.close()
+    await ai_core.close()
+    await llm_client.close()
+
+def build_application(with_updater=True):
+    """with_updater=False时不自己拉取更新（分片工作进程由前端转发）"""
     handlers = BotHandlers()
-    updater = Updater(token=TELEGRAM_TOKEN, use_context=True)
-    dp = updater.dispatcher
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(MAX_CONCURRENT_UPDATES)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.build()
+    application.bot_data["handlers"] = handlers
 
-    dp.add_handler(CommandHandler("status", handlers.handle_status))
-    dp.add_handler(CommandHandler("set_relation", handlers.handle_set_relation))
-    dp.add_handler(CommandHandler("export", export_chat_history))
-    dp.add_handler(MessageHandler(Filters.text & ~Filters.command, handlers.handle_message))
-    dp.add_error_handler(handlers.error_handler)
+    application.add_handler(CommandHandler("status", handlers.handle_status))
+    application.add_handler(CommandHandler("set_relation", handlers.handle_set_relation))
+    application.add_handler(CommandHandler("export", handlers.handle_export))
+    application.add_handler(MessageHandler(filters.TEXT & filters.Regex(r"^\s*//"), handlers.handle_system_command))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handlers.handle_message))
+    application.add_error_handler(handlers.error_handler)
+    return application
 
-    # 1分钟保活任务
-    def keep_alive():
-        logger.info("保活任务 | Bot正常运行中")
-        handlers.loop.call_later(KEEP_ALIVE_INTERVAL, keep_alive)
-    keep_alive()
+async def run_webhook(application: Application):
+    """webhook模式：内嵌服务器收推送，更新进入Application的队列统一处理"""
+    server = WebhookServer(application, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+        await application.start()
+        await server.start()
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+def main():
+    application = build_application()
 
     print("\n💬 真人感聊天Bot启动成功！")
     print("✅ 特性：上下文记忆 | 后台日志 | 1分钟保活 | 无重复追加回复")
-    print("🔧 管理员命令：/status | /set_relation <ID> <关系> | /export <用户ID>")
-
-    updater.start_polling(timeout=30, read_latency=2)
-    updater.idle()
+    print("🔧 管理员命令：/status | /set_relation <ID> <关系> | /export <用户ID> [format=jsonl] | //info 等系统命令")
 
-    # 关闭资源
-    handlers.loop.run_until_complete(close_aiohttp_session())
-    handlers.loop.close()
+    # 所有更新在同一个事件循环里并发处理，不再阻塞分发线程
+    if UPDATE_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(timeout=30)
 
 if __name__ == "__main__":
     main()
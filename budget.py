@@ -0,0 +1,37 @@
+import re
+
+# 中日韩字符和全角标点
+CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uac00-\ud7af\uff00-\uffef]")
+MESSAGE_OVERHEAD = 4  # 每条消息的角色/格式开销
+SUMMARY_PREFIX = "之前聊过的内容摘要（供参考，不要复述）：\n"
+
+def estimate_tokens(text):
+    """估算token数：中文约0.6个/字，其余约4个字符1个"""
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) / 4) + 1
+
+def build_context(history, budget, summary=None):
+    """从最新一条往前取，挑出放得进token预算的最长窗口
+
+    history里的记录需带缓存好的tokens属性；放不下的旧对话用摘要代替。
+    """
+    window = []
+    if summary:
+        summary_cost = estimate_tokens(summary) + MESSAGE_OVERHEAD
+        if summary_cost <= budget // 2:
+            budget -= summary_cost
+        else:
+            summary = None
+    used = 0
+    for msg in reversed(history):
+        cost = msg.tokens + MESSAGE_OVERHEAD
+        if used + cost > budget:
+            break
+        window.append(msg.to_dict())
+        used += cost
+    window.reverse()
+    if summary:
+        window.insert(0, {"role": "system", "content": SUMMARY_PREFIX + summary})
+    return window
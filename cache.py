@@ -0,0 +1,76 @@
+import random
+import re
+import time
+from collections import OrderedDict
+
+PUNCT_RE = re.compile(r"[\W_]+")
+REPEAT_RE = re.compile(r"(.)\1+")
+
+def normalize_text(text):
+    """归一化：去标点空白、转小写、压缩重复字（“在吗吗？？”→“在吗”）"""
+    return REPEAT_RE.sub(r"\1", PUNCT_RE.sub("", text.lower()))
+
+class ResponseCache:
+    """LRU+TTL回复缓存，每个键攒一小池回复，命中时随机挑一条"""
+
+    def __init__(self, max_size=1000, ttl=3600, pool_size=3):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.pool_size = pool_size  # 攒满这么多条不同回复后才开始命中
+        self._entries = OrderedDict()  # key -> [过期时间, 回复列表]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(relationship, context, message, version=0):
+        """version是人设版本，人设改了之后旧回复自然失效"""
+        return (
+            version,
+            relationship,
+            tuple(normalize_text(msg.content) for msg in context),
+            normalize_text(message)
+        )
+
+    def get(self, key):
+        """命中返回随机一条缓存回复，否则返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        if len(entry[1]) < self.pool_size:
+            # 回复池还没攒满，继续走上游让回复保持多样
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(entry[1])
+
+    def put(self, key, reply):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [time.monotonic() + self.ttl, []]
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            self._entries.move_to_end(key)
+        if reply not in entry[1] and len(entry[1]) < self.pool_size:
+            entry[1].append(reply)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+    def __len__(self):
+        return len(self._entries)
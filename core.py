@@ -1,9 +1,14 @@
+import asyncio
 import json
 import os
 import random
-import re
+from collections import deque
 from datetime import datetime
 from enum import Enum
+from sentiment import default_scorer
+
+MOOD_HISTORY_SIZE = 100
+STATE_SAVE_DELAY = 2.0  # 连续修改时合并成一次落盘（秒）
 
 class Emotion(Enum):
     HAPPY = "开心"
@@ -15,17 +20,79 @@ class Emotion(Enum):
     LONELY = "孤独"
     NERVOUS = "紧张"
 
+ON_OFF = ("on", "off")
+EMOTION_NAMES = {
+    "happy": "开心", "sad": "伤心", "angry": "生气",
+    "excited": "兴奋", "calm": "平静", "romantic": "浪漫",
+    "lonely": "孤独", "nervous": "紧张"
+}
+RELATION_CHOICES = ("stranger", "friend", "close", "love", "family", "best")
+PERSONALITY_TRAITS = ("openness", "extraversion", "agreeableness", "neuroticism", "conscientiousness")
+
+class Command:
+    """命令定义：处理方法名 + 参数格式
+
+    args里每一项是一个参数：元组表示可选值（不区分大小写），可调用对象表示类型转换。
+    rest=True时多出来的参数原样附在后面；args为None表示处理方法不接收参数。
+    """
+    __slots__ = ("handler", "args", "rest", "usage")
+
+    def __init__(self, handler, args=None, usage="", rest=False):
+        self.handler = handler
+        self.args = args
+        self.rest = rest
+        self.usage = usage
+
+    def parse(self, raw):
+        """校验并转换参数，返回(参数列表, 错误信息)"""
+        if self.args is None:
+            return None, None
+        if len(raw) < len(self.args) or (len(raw) > len(self.args) and not self.rest):
+            return None, f"格式: {self.usage}"
+        parsed = []
+        for spec, value in zip(self.args, raw):
+            if isinstance(spec, tuple):
+                value = value.lower()
+                if value not in spec:
+                    return None, f"参数错误，可用: {', '.join(spec)}"
+            else:
+                try:
+                    value = spec(value)
+                except ValueError:
+                    return None, f"格式: {self.usage}"
+            parsed.append(value)
+        return parsed + raw[len(self.args):], None
+
+# 命令表：查表分发，新增命令只需加一行和对应的处理方法
+COMMANDS = {
+    "info": Command("_get_info", usage="info"),
+    "role": Command("_update_role", (str,), "role 字段=值 ...", rest=True),
+    "online": Command("_set_online", (ON_OFF,), "online on/off"),
+    "emotion": Command("_set_emotion", (tuple(EMOTION_NAMES),), "emotion 情感"),
+    "active": Command("_set_active", (ON_OFF,), "active on/off"),
+    "multi": Command("_set_multi", (ON_OFF,), "multi on/off"),
+    "relation": Command("_set_relation", (RELATION_CHOICES,), "relation 关系类型"),
+    "personality": Command("_set_personality", (PERSONALITY_TRAITS, float), "personality 特质 值(0-1)"),
+    "traits": Command("_set_traits", (str,), "traits 特质1,特质2,..."),
+    "clean": Command("_clean_data", usage="clean")
+}
+
 class AICore:
     def __init__(self, role_config, settings):
         self.role = role_config
         self.settings = settings.copy()
         self.state_file = "state.json"
+        self.save_delay = STATE_SAVE_DELAY
+        self._save_task = None
+        self._save_dirty = False  # 有修改还没写盘（包括写盘过程中又发生的修改）
+        self._writing = None      # 正在执行器里写盘的future
+        self._persist = True      # 为False时命令只改内存（分片模式下其他分片同步过来的命令）
         self.load_state()
         
         # 情感系统
         self.emotion = Emotion(self.settings["emotion"])
         self.energy = 80  # 能量值 0-100
-        self.mood_history = []
+        self.mood_history = deque(maxlen=MOOD_HISTORY_SIZE)  # 环形缓冲，满了自动丢最旧的
         
         # 个性系统
         self.personality = {
@@ -38,7 +105,12 @@ class AICore:
         
         # 实时状态
         self.current_context = ""
+        self.on_change = None  # 角色、情感、性格变化时回调（提示词缓存失效）
         
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
     def load_state(self):
         """加载状态"""
         if os.path.exists(self.state_file):
@@ -51,48 +123,81 @@ class AICore:
                 pass
     
     def save_state(self):
-        """保存状态"""
-        data = {
+        """保存状态：在事件循环里防抖后异步写盘，不在事件循环里时立即写"""
+        if not self._persist:
+            return
+        self._save_dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush_state()
+            return
+        if self._save_task is None or self._save_task.done():
+            self._save_task = loop.create_task(self._save_later())
+
+    async def _save_later(self):
+        loop = asyncio.get_running_loop()
+        # 写盘期间又有修改时再来一轮，不会漏掉
+        while self._save_dirty:
+            await asyncio.sleep(self.save_delay)
+            self._save_dirty = False
+            data = self._state_json()  # 在事件循环线程里序列化，避免写盘时状态被改
+            self._writing = loop.run_in_executor(None, self._write_state, data)
+            await asyncio.shield(self._writing)
+
+    async def close(self):
+        """退出前把还没落盘的修改写掉"""
+        if self._save_task and not self._save_task.done():
+            self._save_task.cancel()
+            await asyncio.gather(self._save_task, return_exceptions=True)
+        if self._writing and not self._writing.done():
+            # 取消不会停下执行器里的写盘，等它写完再写最新状态
+            await asyncio.gather(self._writing, return_exceptions=True)
+        if self._save_dirty:
+            self.flush_state()
+
+    def flush_state(self):
+        self._save_dirty = False
+        self._write_state(self._state_json())
+
+    def _state_json(self):
+        return json.dumps({
             "role": self.role,
             "settings": self.settings,
             "last_update": datetime.now().isoformat()
-        }
-        with open(self.state_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        }, ensure_ascii=False, indent=2)
+
+    def _write_state(self, data):
+        """先写临时文件再原子替换，写到一半崩溃也不会损坏state.json"""
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
     
-    def process_command(self, command):
-        """处理系统命令"""
+    def process_command(self, command, persist=True):
+        """处理系统命令（查COMMANDS表分发）；persist=False时不写state.json"""
         cmd_parts = command.strip().split()
         if not cmd_parts:
             return False, "无效命令"
         
         base_cmd = cmd_parts[0].lower()
+        spec = COMMANDS.get(base_cmd)
+        if spec is None:
+            return False, f"未知命令: {base_cmd}"
+        args, error = spec.parse(cmd_parts[1:])
+        if error:
+            return False, error
         
+        self._persist = persist
         try:
-            if base_cmd == "info":
-                return self._get_info()
-            elif base_cmd == "role":
-                return self._update_role(cmd_parts[1:])
-            elif base_cmd == "online":
-                return self._set_online(cmd_parts[1:])
-            elif base_cmd == "emotion":
-                return self._set_emotion(cmd_parts[1:])
-            elif base_cmd == "active":
-                return self._set_active(cmd_parts[1:])
-            elif base_cmd == "multi":
-                return self._set_multi(cmd_parts[1:])
-            elif base_cmd == "relation":
-                return self._set_relation(cmd_parts[1:])
-            elif base_cmd == "personality":
-                return self._set_personality(cmd_parts[1:])
-            elif base_cmd == "traits":
-                return self._set_traits(cmd_parts[1:])
-            elif base_cmd == "clean":
-                return self._clean_data()
-            else:
-                return False, f"未知命令: {base_cmd}"
+            handler = getattr(self, spec.handler)
+            return handler() if spec.args is None else handler(args)
         except Exception as e:
             return False, f"命令错误: {str(e)}"
+        finally:
+            self._persist = True
     
     def _get_info(self):
         """获取系统信息"""
@@ -111,7 +216,7 @@ class AICore:
     
     def _update_role(self, args):
         """更新角色信息"""
-        if len(args) < 2:
+        if not args:
             return False, "格式: role 字段=值"
         
         updates = {}
@@ -129,6 +234,8 @@ class AICore:
                     self.role[key] = value
                     updates[key] = value
         
+        if updates:
+            self._changed()
         self.save_state()
         return True, f"角色更新: {updates}"
     
@@ -156,19 +263,16 @@ class AICore:
             return False, "格式: emotion 情感"
         
         emotion_str = args[0].lower()
-        emotion_map = {
-            "happy": "开心", "sad": "伤心", "angry": "生气",
-            "excited": "兴奋", "calm": "平静", "romantic": "浪漫",
-            "lonely": "孤独", "nervous": "紧张"
-        }
         
-        if emotion_str in emotion_map:
-            self.emotion = Emotion(emotion_map[emotion_str])
-            self.settings["emotion"] = emotion_str
+        if emotion_str in EMOTION_NAMES:
+            self.emotion = Emotion(EMOTION_NAMES[emotion_str])
+            # 存中文值，重启时Emotion(...)才能从state.json恢复
+            self.settings["emotion"] = self.emotion.value
+            self._changed()
             self.save_state()
             return True, f"情感已设为: {self.emotion.value}"
         else:
-            return False, f"未知情感，可用: {', '.join(emotion_map.keys())}"
+            return False, f"未知情感，可用: {', '.join(EMOTION_NAMES)}"
     
     def _set_active(self, args):
         """设置主动模式"""
@@ -198,10 +302,9 @@ class AICore:
             return False, "格式: relation 关系类型"
         
         rel_type = args[0].lower()
-        valid_types = ["stranger", "friend", "close", "love", "family", "best"]
         
-        if rel_type not in valid_types:
-            return False, f"无效关系，可用: {', '.join(valid_types)}"
+        if rel_type not in RELATION_CHOICES:
+            return False, f"无效关系，可用: {', '.join(RELATION_CHOICES)}"
         
         self.save_state()
         return True, f"关系已设为: {rel_type}"
@@ -218,6 +321,7 @@ class AICore:
             
             if trait in self.personality:
                 self.personality[trait] = value
+                self._changed()
                 return True, f"{trait} 已设为 {value:.2f}"
             else:
                 return False, f"未知特质: {trait}"
@@ -231,6 +335,7 @@ class AICore:
         
         traits = args[0].split(',')
         self.role["traits"] = traits
+        self._changed()
         self.save_state()
         return True, f"个性已更新: {', '.join(traits)}"
     
@@ -283,9 +388,8 @@ class AICore:
     
     def update_energy(self, user_message):
         """更新能量值"""
-        # 根据消息内容调整能量
-        positive = len(re.findall(r'[好开心快乐棒棒棒]', user_message))
-        negative = len(re.findall(r'[难过伤心生气烦累]', user_message))
+        # 根据消息内容调整能量（词典自动机一遍扫描，处理多字词和否定）
+        positive, negative = default_scorer.score(user_message)
         
         self.energy += positive * 2
         self.energy -= negative * 3
@@ -296,7 +400,4 @@ class AICore:
             "time": datetime.now().isoformat(),
             "energy": self.energy,
             "emotion": self.emotion.value
-        })
-        
-        if len(self.mood_history) > 100:
-            self.mood_history = self.mood_history[-100:]
\ No newline at end of file
+        })
\ No newline at end of file
@@ -0,0 +1,93 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+from storage import SQLiteStore
+
+FORMATS = ("txt", "jsonl", "csv")
+EXPORT_USAGE = "用法: /export <目标用户ID> [format=txt|jsonl|csv] [from=YYYY-MM-DD] [to=YYYY-MM-DD] [limit=条数] [gz=on|off]"
+ROLE_NAMES = {"user": "用户", "assistant": "Bot"}
+
+def parse_export_args(args, tz):
+    """解析 /export 参数，返回(用户ID, 选项)；格式不对抛ValueError"""
+    if not args:
+        raise ValueError(EXPORT_USAGE)
+    options = {"format": "txt", "since": 0, "until": None, "limit": None, "compress": True}
+    for arg in args[1:]:
+        key, sep, value = arg.partition("=")
+        if not sep:
+            raise ValueError(EXPORT_USAGE)
+        key = key.lower()
+        if key == "format" and value.lower() in FORMATS:
+            options["format"] = value.lower()
+        elif key == "from":
+            options["since"] = int(parse_date(value, tz).timestamp())
+        elif key == "to":
+            # 结束日期当天也包含在内
+            options["until"] = int((parse_date(value, tz) + timedelta(days=1)).timestamp())
+        elif key == "limit" and value.isdigit() and int(value) > 0:
+            options["limit"] = int(value)
+        elif key == "gz" and value.lower() in ("on", "off"):
+            options["compress"] = value.lower() == "on"
+        else:
+            raise ValueError(EXPORT_USAGE)
+    return args[0], options
+
+def parse_date(value, tz):
+    try:
+        return tz.localize(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError:
+        raise ValueError(f"日期格式应为YYYY-MM-DD: {value}")
+
+def export_suffix(options):
+    return f".{options['format']}.gz" if options["compress"] else f".{options['format']}"
+
+def export_filename(user_id, options):
+    return f"chat_export_{user_id}{export_suffix(options)}"
+
+def write_rows(f, rows, fmt, user_id, tz):
+    """把(role, content, ts)逐条写进文件，内存里只有当前一页，返回写入条数"""
+    count = 0
+    if fmt == "jsonl":
+        for role, content, ts in rows:
+            f.write(json.dumps({"role": role, "content": content, "ts": ts}, ensure_ascii=False) + "\n")
+            count += 1
+    elif fmt == "csv":
+        writer = csv.writer(f)
+        writer.writerow(["time", "role", "content"])
+        for role, content, ts in rows:
+            writer.writerow([datetime.fromtimestamp(ts, tz).isoformat(), role, content])
+            count += 1
+    else:
+        f.write(f"=== 用户[{user_id}]聊天记录 ===\n")
+        for role, content, ts in rows:
+            when = datetime.fromtimestamp(ts, tz).strftime("%Y-%m-%d %H:%M:%S")
+            f.write(f"[{when}] {ROLE_NAMES.get(role, role)}: {content}\n")
+            count += 1
+        f.write("=== 导出结束 ===\n")
+    return count
+
+def export_to_file(db_path, user_id, options, tz, page_size=500):
+    """分页读取数据库并逐行写入临时文件，返回(文件路径, 导出条数)
+
+    在线程池里运行，自己开一个只读连接，不占用主连接也不阻塞事件循环。
+    """
+    store = SQLiteStore(db_path, readonly=True)
+    fd, path = tempfile.mkstemp(prefix=f"chat_export_{user_id}_", suffix=export_suffix(options))
+    os.close(fd)
+    try:
+        rows = store.iter_messages(
+            user_id, since=options["since"], until=options["until"], limit=options["limit"], page_size=page_size
+        )
+        opener = gzip.open if options["compress"] else open
+        with opener(path, "wt", encoding="utf-8", newline="") as f:
+            count = write_rows(f, rows, options["format"], user_id, tz)
+    except BaseException:
+        os.unlink(path)
+        raise
+    finally:
+        store.close()
+    return path, count
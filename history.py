@@ -0,0 +1,154 @@
+import sys
+import time
+from datetime import datetime
+from budget import estimate_tokens
+
+ROLE_USER = sys.intern("user")
+ROLE_ASSISTANT = sys.intern("assistant")
+ROLE_SYSTEM = sys.intern("system")
+
+def intern_role(role):
+    """角色字符串全局只保留一份（数据库读出的每行都是新字符串）"""
+    if role == ROLE_USER:
+        return ROLE_USER
+    if role == ROLE_ASSISTANT:
+        return ROLE_ASSISTANT
+    return sys.intern(role)
+
+class Message:
+    """单条聊天消息，时间为整数秒时间戳，token数在写入时算好缓存"""
+    __slots__ = ("role", "content", "ts", "tokens")
+
+    def __init__(self, role, content, ts=None):
+        self.role = intern_role(role)
+        self.content = content
+        self.ts = int(ts) if ts is not None else int(time.time())
+        self.tokens = estimate_tokens(content)
+
+    def to_dict(self):
+        """转成API需要的消息格式"""
+        return {"role": self.role, "content": self.content}
+
+class Exchange:
+    """一轮对话（用户一句+AI一句）"""
+    __slots__ = ("ts", "user", "ai")
+
+    def __init__(self, user, ai, ts=None):
+        self.user = user
+        self.ai = ai
+        self.ts = int(ts) if ts is not None else int(time.time())
+
+    def to_dict(self):
+        return {"time": datetime.fromtimestamp(self.ts).isoformat(), "user": self.user, "ai": self.ai}
+
+    def __getitem__(self, key):
+        """兼容以前的字典格式：exchange["user"]、exchange["ai"]、exchange["time"]"""
+        if key == "time":
+            return datetime.fromtimestamp(self.ts).isoformat()
+        if key in ("user", "ai"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+class HistoryRing:
+    """固定容量的环形缓冲区，写满后覆盖最旧的一条"""
+    __slots__ = ("_items", "_start", "_size", "_total")
+
+    def __init__(self, capacity, items=()):
+        self._items = [None] * capacity
+        self._start = 0
+        self._size = 0
+        self._total = 0     # 累计写入条数，视图靠它定位
+        for item in items:
+            self.append(item)
+
+    @property
+    def capacity(self):
+        return len(self._items)
+
+    def append(self, item):
+        """写入一条，返回被挤出的旧记录（没有则为None）"""
+        capacity = len(self._items)
+        self._total += 1
+        if self._size < capacity:
+            self._items[(self._start + self._size) % capacity] = item
+            self._size += 1
+            return None
+        evicted = self._items[self._start]
+        self._items[self._start] = item
+        self._start = (self._start + 1) % capacity
+        return evicted
+
+    def _at(self, seq):
+        """按累计序号取记录，已被覆盖则返回None"""
+        oldest = self._total - self._size
+        if seq < oldest or seq >= self._total:
+            return None
+        return self._items[(self._start + seq - oldest) % len(self._items)]
+
+    def view(self, limit=None):
+        """最近limit条记录的只读视图，不复制数据"""
+        return RingView(self, limit)
+
+    def clear(self):
+        self._items = [None] * len(self._items)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        capacity = len(self._items)
+        for i in range(self._size):
+            yield self._items[(self._start + i) % capacity]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("ring index out of range")
+        return self._items[(self._start + index) % len(self._items)]
+
+class RingView:
+    """创建时刻的窗口：之后再写入的记录不会出现在视图里"""
+    __slots__ = ("_ring", "_first", "_end")
+
+    def __init__(self, ring, limit=None):
+        size = len(ring) if limit is None else min(limit, len(ring))
+        self._ring = ring
+        self._end = ring._total
+        self._first = self._end - size
+
+    def __len__(self):
+        return self._end - self._first
+
+    def __iter__(self):
+        ring = self._ring
+        for seq in range(self._first, self._end):
+            item = ring._at(seq)
+            if item is not None:
+                yield item
+
+    def __getitem__(self, index):
+        size = self._end - self._first
+        if isinstance(index, slice):
+            # 切片复制成列表，和以前get_context返回列表时的用法一致
+            return [self[i] for i in range(*index.indices(size))]
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("view index out of range")
+        item = self._ring._at(self._first + index)
+        if item is None:
+            raise IndexError("view entry was overwritten")
+        return item
+
+    def __bool__(self):
+        return self._end > self._first
+
+    def __reversed__(self):
+        ring = self._ring
+        for seq in range(self._end - 1, self._first - 1, -1):
+            item = ring._at(seq)
+            if item is not None:
+                yield item
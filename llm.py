@@ -0,0 +1,350 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class LLMError(Exception):
+    """上游请求失败"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class PaymentRequired(LLMError):
+    """余额不足（402），重试没有意义"""
+
+class CircuitOpenError(LLMError):
+    """熔断中，直接失败不再请求上游"""
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，冷却后放一个探测请求"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        now = time.monotonic()
+        if now - self.opened_at >= self.reset_timeout:
+            # 半开：每个冷却周期只放行一个探测请求，其余继续快速失败
+            self.state = "half_open"
+            self.opened_at = now
+            return True
+        return False
+
+    def ready(self):
+        """不改状态地判断能否放请求：关闭着，或冷却已过、可以放探测请求"""
+        return self.state == "closed" or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"上游熔断 | 连续失败{self.failures}次，{self.reset_timeout}秒后重试")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+class LLMClient:
+    """OpenAI兼容的对话补全客户端：连接池复用、指数退避重试、熔断"""
+
+    def __init__(self, api_url, api_key, model, timeout=20, retries=3,
+                 backoff_base=0.5, backoff_max=8.0, max_retry_after=30.0,
+                 pool_limit=100, pool_limit_per_host=32, dns_ttl=300, keepalive_timeout=60,
+                 breaker=None, name=None):
+        self.name = name or urlparse(api_url).hostname
+        self.api_url = api_url
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.retry_count = 0
+        self.status_counts = {}  # 非200响应的状态码 -> 次数
+        self._session = None
+        self._loop = None
+
+    async def get_session(self):
+        """复用会话；会话已关闭或事件循环变了就重建"""
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_limit,
+                limit_per_host=self.pool_limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Authorization": f"Bearer {self.api_key}"}
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def describe(self):
+        return f"{self.name}: {self.breaker.state} (重试{self.retry_count}次)"
+
+    def build_payload(self, messages, max_tokens, temperature, stream=False):
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream
+        }
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """带抖动的指数退避；429带Retry-After时按服务端要求等待"""
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2, delay)
+
+    def _count_status(self, status):
+        if status != 200:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    @staticmethod
+    def parse_retry_after(resp):
+        value = resp.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    async def complete(self, messages, max_tokens=100, temperature=1.0, retries=None):
+        """非流式请求，返回回复文本；失败抛出LLMError"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("upstream circuit open")
+        payload = self.build_payload(messages, max_tokens, temperature)
+        attempts = retries if retries is not None else self.retries
+        last_error = None
+        for attempt in range(attempts):
+            retry_after = None
+            try:
+                session = await self.get_session()
+                async with session.post(self.api_url, json=payload) as resp:
+                    self._count_status(resp.status)
+                    if resp.status == 200:
+                        result = await resp.json()
+                        self.breaker.record_success()
+                        return result["choices"][0]["message"]["content"].strip()
+                    if resp.status == 402:
+                        self.breaker.record_success()
+                        raise PaymentRequired("payment required", status=402)
+                    last_error = LLMError(f"upstream status {resp.status}", status=resp.status)
+                    if resp.status not in RETRY_STATUSES:
+                        self.breaker.record_failure()
+                        raise last_error
+                    if resp.status == 429:
+                        retry_after = self.parse_retry_after(resp)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+                last_error = LLMError(f"{type(e).__name__}: {str(e)}")
+            self.breaker.record_failure()
+            if attempt < attempts - 1:
+                if not self.breaker.allow():
+                    break
+                self.retry_count += 1
+                await asyncio.sleep(self.backoff_delay(attempt, retry_after))
+        raise last_error or CircuitOpenError("upstream circuit open")
+
+    async def stream(self, messages, max_tokens=100, temperature=1.0):
+        """流式请求：逐块产出回复文本（解析SSE的data行），不重试"""
+        if not self.breaker.allow():
+            raise CircuitOpenError("upstream circuit open")
+        payload = self.build_payload(messages, max_tokens, temperature, stream=True)
+        try:
+            session = await self.get_session()
+            async with session.post(self.api_url, json=payload) as resp:
+                self._count_status(resp.status)
+                if resp.status == 402:
+                    self.breaker.record_success()
+                    raise PaymentRequired("payment required", status=402)
+                if resp.status != 200:
+                    self.breaker.record_failure()
+                    raise LLMError(f"upstream status {resp.status}", status=resp.status)
+                self.breaker.record_success()
+                async for raw_line in resp.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.breaker.record_failure()
+            raise LLMError(f"{type(e).__name__}: {str(e)}")
+
+class LatencyWindow:
+    """滑动窗口内的请求延迟（秒）"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        """第p百分位延迟，没有样本时返回None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self.samples)
+
+class LLMRouter:
+    """多端点路由：选最快的健康端点，可选超过p95仍未返回时对冲一次"""
+
+    def __init__(self, clients, window=200, hedge=False, hedge_percentile=95, hedge_min_delay=1.0):
+        self.clients = list(clients)
+        self.windows = {client.name: LatencyWindow(window) for client in self.clients}
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay  # 样本不足或p95太小时的对冲等待下限
+        self.hedge_count = 0
+        self.hedge_wins = 0
+        self.on_latency = None  # on_latency(端点名, 秒)，每次成功请求后回调（指标用）
+
+    def ranked(self):
+        """健康端点按p50延迟排序；还没样本的排前面，先探测一下
+
+        熔断后冷却期已过的端点也参与排序，否则没人调用它的allow()，永远不会被再探测。
+        """
+        healthy = [client for client in self.clients if client.breaker.ready()]
+        if not healthy:
+            # 全部熔断时交给各自的熔断器决定是否放探测请求
+            healthy = list(self.clients)
+        return sorted(healthy, key=lambda client: self.windows[client.name].percentile(50) or 0.0)
+
+    async def _timed_complete(self, client, *args, **kwargs):
+        started = time.monotonic()
+        result = await client.complete(*args, **kwargs)
+        self._record(client, time.monotonic() - started)
+        return result
+
+    def _record(self, client, seconds):
+        self.windows[client.name].add(seconds)
+        if self.on_latency:
+            self.on_latency(client.name, seconds)
+
+    async def complete(self, messages, max_tokens=100, temperature=1.0, retries=None):
+        """路由到最快端点；失败时依次换下一个端点"""
+        candidates = self.ranked()
+        last_error = None
+        while candidates:
+            client = candidates.pop(0)
+            try:
+                if self.hedge and candidates:
+                    return await self._hedged(client, candidates.pop(0), messages, max_tokens, temperature, retries)
+                return await self._timed_complete(client, messages, max_tokens, temperature, retries)
+            except LLMError as e:
+                last_error = e
+        raise last_error or CircuitOpenError("no upstream available")
+
+    async def _hedged(self, primary, backup, *args):
+        """主请求超过p95延迟还没返回，就向备用端点再发一次，先到先用"""
+        deadline = max(self.hedge_min_delay, self.windows[primary.name].percentile(self.hedge_percentile) or 0.0)
+        started = time.monotonic()
+        first = asyncio.create_task(self._timed_complete(primary, *args))
+        done, _ = await asyncio.wait({first}, timeout=deadline)
+        if done:
+            if first.exception() is None:
+                return first.result()
+            # 主请求在截止前就失败了，直接走备用
+            return await self._timed_complete(backup, *args)
+
+        self.hedge_count += 1
+        second = asyncio.create_task(self._timed_complete(backup, *args))
+        pending = {first, second}
+        last_error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    last_error = task.exception()
+        finally:
+            # 取消慢的那个请求，已等待的时间作为它的延迟下限记入窗口，免得一直选中它
+            for task in pending:
+                task.cancel()
+                client = primary if task is first else backup
+                self.windows[client.name].add(time.monotonic() - started)
+        raise last_error
+
+    async def stream(self, messages, max_tokens=100, temperature=1.0):
+        """流式请求走最快端点；还没产出文本就失败时换下一个端点"""
+        last_error = None
+        for client in self.ranked():
+            started = time.monotonic()
+            produced = False
+            try:
+                async for delta in client.stream(messages, max_tokens, temperature):
+                    if not produced:
+                        produced = True
+                        # 流式请求以首字延迟计入窗口
+                        self._record(client, time.monotonic() - started)
+                    yield delta
+                return
+            except LLMError as e:
+                if produced:
+                    raise
+                last_error = e
+        raise last_error or CircuitOpenError("no upstream available")
+
+    async def close(self):
+        for client in self.clients:
+            await client.close()
+
+    def describe(self):
+        lines = []
+        for client in self.clients:
+            window = self.windows[client.name]
+            p50, p95 = window.percentile(50), window.percentile(95)
+            latency = f"p50 {p50:.2f}s / p95 {p95:.2f}s" if p50 is not None else "暂无样本"
+            lines.append(f"{client.describe()} | {latency}")
+        if self.hedge:
+            lines.append(f"对冲请求 {self.hedge_count} 次，备用胜出 {self.hedge_wins} 次")
+        return "\n".join(lines)
@@ -0,0 +1,111 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+import time
+from datetime import datetime
+
+CONSOLE_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+# LogRecord自带的属性，其余的（extra=传进来的）写进JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """一行一个JSON：时间、级别、来源、消息，加上extra里的字段（user_id等）"""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key != "sample":
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class SampleFilter(logging.Filter):
+    """按比例采样带 extra={"sample": True} 的逐条消息日志，其他日志全部保留"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if self.rate >= 1.0 or not getattr(record, "sample", False):
+            return True
+        return random.random() < self.rate
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """只把记录放进队列；拼接消息、格式化都留给后台线程
+
+    默认的prepare会在调用线程里格式化消息，这里队列在进程内，不需要。
+    """
+
+    def prepare(self, record):
+        return record
+
+class RotatingGzipFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小或时间轮转，旧文件gzip压缩：chat.log.1.gz、chat.log.2.gz ..."""
+
+    def __init__(self, filename, max_bytes=5 * 1024 * 1024, backup_count=5, interval=86400):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.interval = interval
+        self.rollover_at = self._next_rollover()
+        self.namer = lambda name: name + ".gz"
+        self.rotator = self._gzip_rotate
+
+    def _next_rollover(self):
+        return time.time() + self.interval if self.interval else float("inf")
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at and os.path.exists(self.baseFilename):
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = self._next_rollover()
+
+    @staticmethod
+    def _gzip_rotate(source, dest):
+        if not os.path.exists(source):
+            return
+        with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+            shutil.copyfileobj(f_in, f_out)
+        os.remove(source)
+
+def setup_logging(path="chat.log", level=logging.INFO, max_bytes=5 * 1024 * 1024, backup_count=5,
+                  rotate_interval=86400, sample_rate=1.0, console=True):
+    """把根日志接到队列上，由后台线程写JSON文件和控制台，返回已启动的QueueListener"""
+    file_handler = RotatingGzipFileHandler(path, max_bytes, backup_count, rotate_interval)
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SampleFilter(sample_rate))
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [queue_handler]
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_listener, listener)  # 退出前把队列里剩下的日志写完
+    return listener
+
+def stop_listener(listener):
+    """停止后台写日志线程；已经停过的不再重复停"""
+    if listener._thread is not None:
+        listener.stop()
@@ -1,16 +1,50 @@
+import atexit
 import json
 import os
+import threading
+import time
 from datetime import datetime
-from collections import defaultdict
+from history import Exchange, HistoryRing
+from userstate import ColdStore, TieredUsers
+
+CONVERSATION_LENGTH = 50  # 每个用户保留的对话轮数
 
 class MemorySystem:
-    def __init__(self, user_file="users.json"):
+    def __init__(self, user_file="users.json", flush_interval=2.0, compact_every=1000, store=None,
+                 max_conversations=1000, max_users=1000):
         self.user_file = user_file
-        self.users = self._load_users()
-        self.conversations = defaultdict(list)
-        
+        self.store = store                      # 可选的SQLiteStore，对话记录写入数据库
+        self.journal_file = f"{user_file}.journal"
+        self.flush_interval = flush_interval    # 秒，批量写日志的最短间隔
+        self.compact_every = compact_every      # 日志条数超过该值时合并成快照
+        self._dirty = set()
+        # 用户资料同样只留最近活跃的在内存里，快照和日志仍是完整数据；
+        # 资料本身就是JSON字典，换出时原样交给marshal。还没写进日志的用户不换出
+        self.users = TieredUsers(
+            lambda user: user,
+            lambda user: user,
+            ColdStore(f"{user_file}.users.cold"),
+            max_hot=max_users,
+            pinned=lambda uid, user: uid in self._dirty
+        )
+        for uid, user in self._load_users().items():
+            self.users[uid] = user
+        # 对话缓冲只在内存里留最近活跃的用户，其余换出到溢出文件，下次访问再读回
+        self.conversations = TieredUsers(
+            self._dump_conversation,
+            self._load_conversation,
+            ColdStore(f"{user_file}.cold"),
+            max_hot=max_conversations,
+            last_active=lambda conversation: conversation[-1].ts if len(conversation) else 0
+        )
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()          # 定时刷盘在后台线程，和修改用户数据互斥
+        self._timer = None
+        self._journal_count = self._replay_journal()
+        atexit.register(self.close)
+
     def _load_users(self):
-        """加载用户数据"""
+        """加载用户数据快照"""
         if os.path.exists(self.user_file):
             try:
                 with open(self.user_file, 'r', encoding='utf-8') as f:
@@ -18,17 +52,98 @@ class MemorySystem:
             except:
                 return {}
         return {}
-    
+
+    def _replay_journal(self):
+        """在快照之上重放追加日志，返回日志条数"""
+        if not os.path.exists(self.journal_file):
+            return 0
+        count = 0
+        good = 0  # 最后一条完整记录结束的字节偏移
+        with open(self.journal_file, 'r+b') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("missing newline")
+                    record = json.loads(line)
+                except ValueError:
+                    # 写到一半崩溃留下的残行，之后的内容都不可信
+                    break
+                self.users[record["uid"]] = record["user"]
+                good += len(line)
+                count += 1
+            # 截掉残行，否则下次追加会接在残行后面，那一行在每次重启时都被丢弃
+            f.truncate(good)
+        return count
+
+    def _mark_dirty(self, uid):
+        """标记用户已修改，到达间隔后批量写入日志，否则定时写入"""
+        with self._lock:
+            self._dirty.add(uid)
+            delay = self._last_flush + self.flush_interval - time.monotonic()
+            if delay <= 0:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """把修改过的用户追加写入日志，必要时合并快照"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._last_flush = time.monotonic()
+            self._append_journal()
+            # 写进日志后不再固定，补上被固定或读回时超出的预算
+            self.users.evict()
+            if self._journal_count >= self.compact_every:
+                self.save_users()
+
+    def close(self):
+        """停掉定时器，把剩下的修改写进日志，删掉溢出文件"""
+        self.flush()
+        self.users.close()
+        self.conversations.close()
+
+    def _append_journal(self):
+        """每个修改过的用户追加一行完整记录"""
+        if not self._dirty:
+            return
+        lines = [
+            json.dumps({"uid": uid, "user": self.users[uid]}, ensure_ascii=False, separators=(',', ':'))
+            for uid in self._dirty if uid in self.users
+        ]
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        self._journal_count += len(lines)
+        self._dirty.clear()
+
     def save_users(self):
-        """保存用户数据"""
-        with open(self.user_file, 'w', encoding='utf-8') as f:
-            json.dump(self.users, f, ensure_ascii=False, indent=2)
-    
+        """合并快照：原子替换users.json并清空日志"""
+        with self._lock:
+            # 先把未落盘的修改写进日志，快照写到一半崩溃时重放日志结果不变
+            self._append_journal()
+            tmp_file = f"{self.user_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                # 逐个写出热、冷两级的用户，冷用户不换回内存
+                f.write("{")
+                for i, uid in enumerate(self.users):
+                    user = json.dumps(self.users.peek(uid), ensure_ascii=False)
+                    f.write(f"{',' if i else ''}\n  {json.dumps(uid)}: {user}")
+                f.write("\n}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.user_file)
+            open(self.journal_file, 'w').close()
+            self._journal_count = 0
+
     def get_user(self, user_id):
         """获取用户信息"""
         uid = str(user_id)
-        if uid not in self.users:
-            self.users[uid] = {
+        user = self.users.get(uid)
+        if user is None:
+            user = self.users[uid] = {
                 "first_seen": datetime.now().isoformat(),
                 "message_count": 0,
                 "last_active": datetime.now().isoformat(),
@@ -36,51 +151,83 @@ class MemorySystem:
                 "topics": [],
                 "secrets": []
             }
-        return self.users[uid]
-    
+        return user
+
     def add_message(self, user_id, user_msg, ai_msg):
         """添加对话记录"""
         uid = str(user_id)
-        user = self.get_user(uid)
-        
-        # 更新用户数据
-        user["message_count"] += 1
-        user["last_active"] = datetime.now().isoformat()
-        
-        # 添加到对话历史
-        self.conversations[uid].append({
-            "time": datetime.now().isoformat(),
-            "user": user_msg[:200],
-            "ai": ai_msg[:200]
-        })
-        
-        # 保持最近50条对话
-        if len(self.conversations[uid]) > 50:
-            self.conversations[uid] = self.conversations[uid][-50:]
-        
+        with self._lock:
+            user = self.get_user(uid)
+
+            # 更新用户数据
+            user["message_count"] += 1
+            user["last_active"] = datetime.now().isoformat()
+
+        # 添加到对话历史（环形缓冲，只保留最近50轮）
+        self._get_conversation(uid).append(Exchange(user_msg[:200], ai_msg[:200]))
+        self.conversations.touch(uid)
+
+        if self.store:
+            self.store.add_message(uid, "user", user_msg)
+            self.store.add_message(uid, "assistant", ai_msg)
+
         # 保存
-        self.save_users()
-    
+        with self._lock:
+            self._mark_dirty(uid)
+            self.users.touch(uid)
+
     def get_context(self, user_id, limit=5):
         """获取对话上下文"""
         uid = str(user_id)
-        if uid in self.conversations:
-            return self.conversations[uid][-limit:]
-        return []
-    
+        if uid not in self.conversations and not self.store:
+            return []
+        return self._get_conversation(uid).view(limit)
+
+    @staticmethod
+    def _dump_conversation(conversation):
+        return [(exchange.user, exchange.ai, exchange.ts) for exchange in conversation]
+
+    @staticmethod
+    def _load_conversation(record):
+        return HistoryRing(CONVERSATION_LENGTH, (Exchange(*exchange) for exchange in record))
+
+    def _get_conversation(self, uid):
+        """取用户的对话缓冲，首次访问时从数据库恢复"""
+        conversation = self.conversations.get(uid)
+        if conversation is None:
+            conversation = self.conversations[uid] = HistoryRing(CONVERSATION_LENGTH)
+            if self.store:
+                pending = None
+                for role, content, ts in self.store.get_recent(uid, CONVERSATION_LENGTH * 2):
+                    if role == "user":
+                        if pending:
+                            conversation.append(pending)
+                        pending = Exchange(content[:200], "", ts)
+                    elif pending:
+                        pending.ai = content[:200]
+                        conversation.append(pending)
+                        pending = None
+                if pending:
+                    conversation.append(pending)
+        return conversation
+
     def update_relationship(self, user_id, relationship):
         """更新关系"""
         uid = str(user_id)
-        user = self.get_user(uid)
-        user["relationship"] = relationship
-        self.save_users()
-    
+        with self._lock:
+            user = self.get_user(uid)
+            user["relationship"] = relationship
+        if self.store:
+            self.store.set_relationship(uid, relationship)
+        self._mark_dirty(uid)
+
     def add_secret(self, user_id, secret):
         """添加秘密"""
         uid = str(user_id)
-        user = self.get_user(uid)
-        user["secrets"].append({
-            "time": datetime.now().isoformat(),
-            "content": secret[:100]
-        })
-        self.save_users()
\ No newline at end of file
+        with self._lock:
+            user = self.get_user(uid)
+            user["secrets"].append({
+                "time": datetime.now().isoformat(),
+                "content": secret[:100]
+            })
+        self._mark_dirty(uid)
@@ -0,0 +1,141 @@
+import bisect
+import logging
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# 延迟类直方图的默认分桶（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+def _format_labels(label, value):
+    return f'{{{label}="{value}"}}' if label and value != "" else ""
+
+class Counter:
+    """只增计数器；func不为空时渲染时直接读取（已有的计数属性不必重复计数）
+
+    func可以返回数字，或者在带label时返回 {标签值: 数字}。
+    """
+
+    def __init__(self, name, help_text, label=None, func=None):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.func = func
+        self.values = {}
+
+    def inc(self, amount=1, label_value=""):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def collect(self):
+        if self.func is None:
+            return dict(self.values) or {"": 0}
+        value = self.func()
+        return value if isinstance(value, dict) else {"": value}
+
+    def render(self, kind="counter"):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {kind}"]
+        for label_value, value in self.collect().items():
+            lines.append(f"{self.name}{_format_labels(self.label, label_value)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """当前值，可增可减；一般用func在渲染时读取"""
+
+    def set(self, value, label_value=""):
+        self.values[label_value] = value
+
+    def render(self, kind="gauge"):
+        return super().render(kind)
+
+class Histogram:
+    """固定分桶直方图：observe只做一次二分查找和两次加法"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一格是+Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按分桶线性插值估算分位数，没有样本时返回None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower  # 落在+Inf桶，只能给出下界
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        """Prometheus文本格式"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """本地 /metrics 接口，供Prometheus抓取或curl查看"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9108, path="/metrics"):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.path = path
+        self.web_app = web.Application()
+        self.web_app.router.add_get(path, self.handle_metrics)
+        self._runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8")
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics | 监听 {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,123 @@
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+
+from aiohttp import web
+
+MOCK_REPLIES = ["哈哈是吗", "然后呢～", "我也觉得", "今天有点累", "好呀好呀", "真的假的"]
+
+class MockLLMServer:
+    """本地OpenAI兼容对话补全接口：可配置延迟、错误率和流式输出，压测用"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.3, jitter=0.1, error_rate=0.0,
+                 error_status=503, chunk_delay=0.02, path="/v1/chat/completions"):
+        self.host = host
+        self.port = port              # 0表示随机端口，启动后读self.port
+        self.latency = latency        # 首字/整体延迟（秒）
+        self.jitter = jitter          # 延迟随机浮动（秒）
+        self.error_rate = error_rate  # 按概率返回error_status
+        self.error_status = error_status
+        self.chunk_delay = chunk_delay
+        self.path = path
+        self.calls = 0
+        self.stream_calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_completion)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}{self.path}"
+
+    async def handle_completion(self, request):
+        payload = await request.json()
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return web.json_response({"error": "mock error"}, status=self.error_status)
+            reply = random.choice(MOCK_REPLIES)
+            if payload.get("stream"):
+                self.stream_calls += 1
+                return await self.stream_reply(request, reply)
+            return web.json_response({"choices": [{"message": {"role": "assistant", "content": reply}}]})
+        finally:
+            self.in_flight -= 1
+
+    async def stream_reply(self, request, reply):
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        for i in range(0, len(reply), 2):
+            chunk = {"choices": [{"delta": {"content": reply[i:i + 2]}}]}
+            await resp.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(self.chunk_delay)
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+class MockTelegramBot:
+    """代替telegram.Bot的出站接口：记录每次调用，并按聊天统计回复延迟
+
+    replayer在投递更新时调用expect(chat_id)，第一条send_message到达时记一次延迟；
+    被合并的连发消息一起算作已回复。
+    """
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self.reply_latencies = []
+        self.waiting = defaultdict(deque)  # chat_id -> 等待回复的投递时间
+        self._message_ids = itertools.count(1)
+
+    def expect(self, chat_id):
+        self.waiting[chat_id].append(time.monotonic())
+
+    @property
+    def pending(self):
+        return sum(len(queue) for queue in self.waiting.values())
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls["send_message"] += 1
+        now = time.monotonic()
+        queue = self.waiting.get(chat_id)
+        while queue:
+            self.reply_latencies.append(now - queue.popleft())
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(chat_id=chat_id, message_id=next(self._message_ids), text=text)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.calls["edit_message_text"] += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(chat_id=chat_id, message_id=message_id, text=text)
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        self.calls["send_chat_action"] += 1
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def send_document(self, chat_id, document, **kwargs):
+        self.calls["send_document"] += 1
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(chat_id=chat_id, message_id=next(self._message_ids))
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+class TimerWheel:
+    """哈希时间轮：加入/取消O(1)，每个tick只检查一个槽"""
+
+    def __init__(self, tick=1.0, slots=3600):
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]  # 槽内 key -> 到期tick
+        self.index = {}                              # key -> 所在槽号，用于O(1)取消
+        self.current = int(time.time() / tick)
+
+    def schedule(self, key, due):
+        """安排key在时间戳due到期，已存在则改期"""
+        self.cancel(key)
+        due_tick = max(self.current + 1, int(due / self.tick))
+        slot = due_tick % len(self.slots)
+        self.slots[slot][key] = due_tick
+        self.index[key] = slot
+
+    def cancel(self, key):
+        slot = self.index.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+
+    def advance(self, now=None):
+        """走到当前时间，返回到期的key列表"""
+        target = int((now if now is not None else time.time()) / self.tick)
+        due = []
+        # 落后超过一圈时每个槽看一次就够了
+        start = max(self.current + 1, target - len(self.slots) + 1)
+        for tick in range(start, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            if not bucket:
+                continue
+            fired = [key for key, due_tick in bucket.items() if due_tick <= target]
+            for key in fired:
+                del bucket[key]
+                del self.index[key]
+            due.extend(fired)
+        self.current = max(self.current, target)
+        return due
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+class ProactiveScheduler:
+    """主动消息：按最后活跃时间和关系安排每个用户的下一次问候"""
+
+    def __init__(self, send_checkin, is_enabled, intervals, quiet_hours=(23, 8), timezone=None,
+                 jitter=0.2, tick=1.0, batch_size=20):
+        self.send_checkin = send_checkin  # async send_checkin(user_id)
+        self.is_enabled = is_enabled      # 返回当前是否开启主动消息
+        self.intervals = intervals        # 关系 -> 沉默多久后主动找（秒），没有的关系不主动
+        self.quiet_hours = quiet_hours    # (开始小时, 结束小时)，本地时间
+        self.timezone = timezone
+        self.jitter = jitter              # 间隔随机浮动比例，避免同时触发
+        self.batch_size = batch_size      # 每个tick最多发出几条
+        self.wheel = TimerWheel(tick)
+        self.ready = deque()
+        self.sent_count = 0
+        self._task = None
+
+    def touch(self, user_id, relationship, last_active):
+        """用户有新消息时调用，重新安排下一次问候"""
+        interval = self.intervals.get(relationship)
+        if not interval:
+            self.wheel.cancel(user_id)
+            return
+        due = last_active + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        now = time.time()
+        if due < now:
+            # 重启后已经过期的用户分散到接下来的一段时间里，不在第一秒全部触发
+            due = now + random.uniform(0, interval * self.jitter)
+        self.wheel.schedule(user_id, due)
+
+    def forget(self, user_id):
+        self.wheel.cancel(user_id)
+
+    def in_quiet_hours(self, now):
+        start, end = self.quiet_hours
+        hour = datetime.fromtimestamp(now, self.timezone).hour
+        if start <= end:
+            return start <= hour < end
+        return hour >= start or hour < end
+
+    def quiet_end(self, now):
+        """免打扰结束的时间戳，再加一点随机，避免整点一齐发"""
+        local = datetime.fromtimestamp(now, self.timezone)
+        end = local.replace(hour=self.quiet_hours[1], minute=0, second=0, microsecond=0)
+        if end <= local:
+            end += timedelta(days=1)
+        return end.timestamp() + random.uniform(0, 3600)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.wheel.tick)
+            now = time.time()
+            self.ready.extend(self.wheel.advance(now))
+            if not self.ready:
+                continue
+            if not self.is_enabled():
+                # 关闭期间到期的用户顺延一个周期，重新开启后还能继续
+                while self.ready:
+                    self.wheel.schedule(self.ready.popleft(), now + max(self.intervals.values()))
+                continue
+            if self.in_quiet_hours(now):
+                end = self.quiet_end(now)
+                while self.ready:
+                    self.wheel.schedule(self.ready.popleft(), end)
+                continue
+            batch = [self.ready.popleft() for _ in range(min(self.batch_size, len(self.ready)))]
+            results = await asyncio.gather(*(self.send_checkin(user_id) for user_id in batch), return_exceptions=True)
+            for user_id, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    logger.warning(f"用户[{user_id}] | 主动消息失败: {str(result)}")
+                else:
+                    self.sent_count += 1
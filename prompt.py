@@ -0,0 +1,68 @@
+from budget import estimate_tokens
+
+RELATION_PROMPTS = {
+    "love": """你和对象线上聊天，语气亲昵撒娇，像真人唠嗑一样自然。
+    一定要参考之前的聊天历史，记住对方说过的话，回复要接得上上一句的话题。
+    回复很短，一两句就够，绝对不要括号动作（比如笑、抱抱），内容不重复。""",
+    "friend": """你和好朋友线上聊天，语气随意接地气，会接梗吐槽带口头禅。
+    参考之前的聊天内容，别跑偏，回复简短自然，不啰嗦。""",
+    "stranger": """你和刚认识的人线上聊天，礼貌温和不尴尬，会找小话题但不查户口。
+    记住对方说过的基本信息，回复简短，慢慢拉近距离。"""
+}
+
+# 性格维度偏高/偏低时的描述，中间值不写
+PERSONALITY_HINTS = {
+    "openness": ("喜欢尝试新鲜事", "比较守旧"),
+    "extraversion": ("外向健谈", "有点内向"),
+    "agreeableness": ("好说话、会体谅人", "有点小脾气"),
+    "neuroticism": ("情绪起伏大、容易多想", "情绪稳定"),
+    "conscientiousness": ("做事认真靠谱", "随性散漫")
+}
+PERSONALITY_HIGH = 0.65
+PERSONALITY_LOW = 0.35
+
+class PromptBuilder:
+    """系统提示词组装：人设+心情+性格+关系，编译结果和token数缓存到人设变化为止
+
+    人设部分放在最前面，所有用户共享同一段前缀，便于上游做前缀缓存。
+    """
+
+    def __init__(self, core):
+        self.core = core
+        self._cache = {}  # 关系 -> (提示词, token数)
+        self.builds = 0
+        self.version = 0  # 人设版本，每次变化加一；回复缓存的键带上它，旧人设的回复不再命中
+        core.on_change = self.invalidate
+
+    def invalidate(self):
+        self._cache.clear()
+        self.version += 1
+
+    def get(self, relationship):
+        """返回(系统提示词, token数)"""
+        key = relationship if relationship in RELATION_PROMPTS else "stranger"
+        entry = self._cache.get(key)
+        if entry is None:
+            prompt = self.persona() + "\n" + RELATION_PROMPTS[key]
+            entry = self._cache[key] = (prompt, estimate_tokens(prompt))
+            self.builds += 1
+        return entry
+
+    def persona(self):
+        role = self.core.role
+        lines = [
+            f"你叫{role['name']}，{role['age']}岁，{role['gender']}，{role['job']}，住在{role['city']}。",
+            f"性格：{'、'.join(role['traits'])}。喜欢：{'、'.join(role['likes'])}。",
+            f"现在的状态：{role['status']}。",
+            f"你此刻的心情：{self.core.emotion.value}。"
+        ]
+        hints = []
+        for trait, value in self.core.personality.items():
+            high, low = PERSONALITY_HINTS.get(trait, (None, None))
+            if value >= PERSONALITY_HIGH and high:
+                hints.append(high)
+            elif value <= PERSONALITY_LOW and low:
+                hints.append(low)
+        if hints:
+            lines.append(f"为人{'，'.join(hints)}。")
+        return "\n".join(lines)
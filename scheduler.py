@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class ChatScheduler:
+    """按聊天分队列的调度器：同一聊天严格按顺序处理，全局限制并发数"""
+
+    def __init__(self, handler, max_in_flight=64, max_pending=5, max_queued=2000, merge=None, debounce=0,
+                 max_wait=None):
+        self.handler = handler            # async handler(key, item)
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending    # 单个聊天最多排队条数
+        self.max_queued = max_queued      # 全局最多排队条数
+        self.merge = merge                # merge(old_item, new_item) -> item，队列满时合并
+        self.debounce = debounce          # 秒，间隔小于该值的连续任务合并为一个
+        # 秒，从第一条算起最多合并这么久，之后的消息另起一条，避免一直连发时迟迟不回复
+        self.max_wait = debounce * 3 if max_wait is None else max_wait
+        self.lanes = {}
+        self.workers = {}
+        self.arrivals = {}
+        self.opened = {}                  # key -> 队尾任务第一条消息到达的时间
+        self.on_idle = None               # on_idle(key)，某个聊天的队列处理完时回调
+        self.queued = 0
+        self.in_flight = 0
+        self.shed_count = 0
+        self.merged_count = 0
+        self._slots = None
+
+    def submit(self, key, item):
+        """提交任务，返回False表示因背压被丢弃"""
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = deque()
+
+        now = asyncio.get_running_loop().time()
+        last_arrival = self.arrivals.get(key)
+        self.arrivals[key] = now
+        if (lane and self.merge is not None and self.debounce and now - last_arrival <= self.debounce
+                and now - self.opened[key] < self.max_wait):
+            # 防抖窗口内的连发消息并入尚未处理的最后一条
+            lane[-1] = self.merge(lane[-1], item)
+            self.merged_count += 1
+        elif len(lane) >= self.max_pending and self.merge is not None:
+            lane[-1] = self.merge(lane[-1], item)
+            self.merged_count += 1
+        elif len(lane) >= self.max_pending or self.queued >= self.max_queued:
+            self.shed_count += 1
+            if not lane and key not in self.workers:
+                del self.lanes[key]
+                self.arrivals.pop(key, None)
+                self.opened.pop(key, None)
+            return False
+        else:
+            lane.append(item)
+            self.opened[key] = now
+            self.queued += 1
+
+        if key not in self.workers:
+            self.workers[key] = asyncio.create_task(self._drain(key, lane))
+        return True
+
+    async def _drain(self, key, lane):
+        """依次处理一个聊天队列里的任务"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        loop = asyncio.get_running_loop()
+        try:
+            while lane:
+                # 队首就是最新一条时，等到窗口内不再有新消息，但从第一条算起不超过max_wait
+                while self.debounce and len(lane) == 1:
+                    deadline = min(self.arrivals[key] + self.debounce, self.opened[key] + self.max_wait)
+                    wait = deadline - loop.time()
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                # 先拿并发名额再出队，等待期间新消息仍可合并进队列
+                async with self._slots:
+                    item = lane.popleft()
+                    self.queued -= 1
+                    self.in_flight += 1
+                    try:
+                        await self.handler(key, item)
+                    except Exception:
+                        logger.exception(f"队列任务失败: {key}")
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            self.workers.pop(key, None)
+            if not lane:
+                self.lanes.pop(key, None)
+                self.arrivals.pop(key, None)
+                self.opened.pop(key, None)
+                if self.on_idle:
+                    self.on_idle(key)
+
+    def pending(self, key):
+        """某个聊天还在排队的任务数"""
+        lane = self.lanes.get(key)
+        return len(lane) if lane else 0
+
+    async def close(self):
+        """取消所有队列任务"""
+        tasks = list(self.workers.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.lanes.clear()
+        self.arrivals.clear()
+        self.opened.clear()
+        self.queued = 0
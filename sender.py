@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# 数字越小越先发
+PRIORITY_ADMIN = 0
+PRIORITY_REPLY = 1
+PRIORITY_EDIT = 2
+PRIORITY_BACKGROUND = 3
+
+def retry_after_seconds(error):
+    """RetryAfter.retry_after 在不同版本里是秒数或timedelta"""
+    value = error.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+def _consume_exception(future):
+    # 不等待结果的调用（中间编辑、输入状态）失败时不打印“异常未被获取”
+    if not future.cancelled():
+        future.exception()
+
+class TokenBucket:
+    """令牌桶：rate个/秒，最多攒capacity个"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now):
+        """还要等多久才有一个令牌，0表示现在就有"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """被限流时清空令牌，seconds秒内不再发放"""
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+    def is_idle(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class SendJob:
+    __slots__ = ("method", "chat_id", "kwargs", "priority", "seq", "future", "attempts", "started", "key")
+
+    def __init__(self, method, chat_id, kwargs, priority, seq, future, key=None):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.attempts = 0
+        self.started = False
+        self.key = key
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class SendScheduler:
+    """出站发送调度：全局+单聊天令牌桶限速、优先级队列、RetryAfter后重排、合并输入状态和编辑"""
+
+    def __init__(self, global_rate=30, chat_rate=1.0, chat_burst=3, max_attempts=3, typing_ttl=4.5):
+        self.bot = None
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_attempts = max_attempts
+        self.typing_ttl = typing_ttl      # 输入状态在客户端约显示5秒，期间不重复发
+        self.chat_buckets = {}
+        self.typing_sent = {}
+        self.pending_edits = {}           # (chat_id, message_id) -> 未发出的编辑任务
+        self.pending_sends = {}           # chat_id -> 未发出的消息数
+        self.sent_count = 0
+        self.retry_after_count = 0
+        self.failed_count = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._worker = None
+        self._tasks = set()
+
+    def set_global_rate(self, rate):
+        """调整全局限速（分片模式下按工作进程数平分）"""
+        bucket = self.global_bucket
+        bucket.rate = bucket.capacity = rate
+        bucket.tokens = min(bucket.tokens, rate)
+
+    def start(self, bot):
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, *self._tasks, return_exceptions=True)
+            self._worker = None
+        for job in self._heap:
+            if not job.future.done():
+                job.future.cancel()
+        self._heap.clear()
+
+    # ---------- 对外接口：返回Future，可以await拿结果 ----------
+    def send_message(self, chat_id, text, priority=PRIORITY_REPLY, **kwargs):
+        self.pending_sends[chat_id] = self.pending_sends.get(chat_id, 0) + 1
+        return self._enqueue("send_message", chat_id, dict(text=text, **kwargs), priority)
+
+    def edit_message(self, chat_id, message_id, text, priority=PRIORITY_EDIT):
+        """同一条消息还没发出的编辑直接替换成最新文本"""
+        key = (chat_id, message_id)
+        job = self.pending_edits.get(key)
+        if job is not None and not job.started:
+            job.kwargs["text"] = text
+            return job.future
+        return self._enqueue("edit_message_text", chat_id, dict(message_id=message_id, text=text), priority, key)
+
+    def send_document(self, chat_id, document, priority=PRIORITY_ADMIN, **kwargs):
+        return self._enqueue("send_document", chat_id, dict(document=document, **kwargs), priority)
+
+    def send_typing(self, chat_id):
+        """输入状态：几秒内发过或者还有消息在排队就不再发"""
+        now = time.monotonic()
+        if now - self.typing_sent.get(chat_id, 0.0) < self.typing_ttl or self.pending_sends.get(chat_id):
+            return
+        self.typing_sent[chat_id] = now
+        self._enqueue("send_chat_action", chat_id, dict(action="typing"), PRIORITY_BACKGROUND, key="typing")
+
+    @property
+    def queued(self):
+        return len(self._heap)
+
+    # ---------- 内部实现 ----------
+    def _enqueue(self, method, chat_id, kwargs, priority, key=None):
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_exception)
+        job = SendJob(method, chat_id, kwargs, priority, next(self._seq), future, key)
+        if key and key != "typing":
+            self.pending_edits[key] = job
+        self._push(job)
+        return future
+
+    def _push(self, job):
+        heapq.heappush(self._heap, job)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self._prune()
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _prune(self):
+        """丢掉已经攒满令牌的空闲聊天，避免字典无限增长"""
+        now = time.monotonic()
+        for chat_id in [cid for cid, bucket in self.chat_buckets.items() if bucket.is_idle(now)]:
+            del self.chat_buckets[chat_id]
+        for chat_id in [cid for cid, ts in self.typing_sent.items() if now - ts >= self.typing_ttl]:
+            del self.typing_sent[chat_id]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job = heapq.heappop(self._heap)
+            if job.future.done():
+                continue
+            is_typing = job.key == "typing"
+            if is_typing and self.pending_sends.get(job.chat_id):
+                # 回复已经在排队了，输入状态没必要再发
+                job.future.cancel()
+                continue
+
+            now = time.monotonic()
+            bucket = self._chat_bucket(job.chat_id)
+            wait = 0.0 if is_typing else bucket.wait_time(now)
+            if wait > 0:
+                loop.call_later(wait, self._push, job)
+                continue
+            global_wait = self.global_bucket.wait_time(now)
+            if global_wait > 0:
+                heapq.heappush(self._heap, job)
+                await asyncio.sleep(global_wait)
+                continue
+
+            if not is_typing:
+                bucket.consume()
+            self.global_bucket.consume()
+            job.started = True
+            task = loop.create_task(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job):
+        job.attempts += 1
+        try:
+            result = await getattr(self.bot, job.method)(chat_id=job.chat_id, **job.kwargs)
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            self.retry_after_count += 1
+            self._chat_bucket(job.chat_id).block(delay)
+            logger.warning(f"发送限流 | 聊天[{job.chat_id}] {delay}秒后重发")
+            if job.attempts < self.max_attempts:
+                job.started = False
+                asyncio.get_running_loop().call_later(delay, self._push, job)
+                return
+            self._finish(job, error=e)
+        except BadRequest as e:
+            # 流式编辑内容没变时Telegram会报错，当作成功
+            self._finish(job, error=None if "not modified" in str(e) else e)
+        except NetworkError as e:
+            if job.attempts < self.max_attempts:
+                job.started = False
+                asyncio.get_running_loop().call_later(job.attempts, self._push, job)
+                return
+            self._finish(job, error=e)
+        except Exception as e:
+            self._finish(job, error=e)
+        else:
+            self.sent_count += 1
+            self._finish(job, result=result)
+
+    def _finish(self, job, result=None, error=None):
+        if job.method == "send_message":
+            remaining = self.pending_sends.get(job.chat_id, 1) - 1
+            if remaining > 0:
+                self.pending_sends[job.chat_id] = remaining
+            else:
+                self.pending_sends.pop(job.chat_id, None)
+        if job.key and self.pending_edits.get(job.key) is job:
+            del self.pending_edits[job.key]
+        if error is not None:
+            self.failed_count += 1
+            logger.warning(f"发送失败 | 聊天[{job.chat_id}] {job.method}: {str(error)}")
+        if job.future.done():
+            return
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
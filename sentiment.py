@@ -0,0 +1,131 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # 没装numpy时批量接口退回标准库array
+    np = None
+
+# 情感词典：词 -> 权重，正数积极、负数消极；多字词按整词匹配
+LEXICON = {
+    "好": 1, "开心": 2, "快乐": 2, "高兴": 2, "棒": 1, "喜欢": 2, "爱": 2,
+    "哈哈": 1, "嘿嘿": 1, "不错": 1, "舒服": 1, "幸福": 2, "期待": 1, "谢谢": 1,
+    "难过": -2, "伤心": -2, "生气": -2, "烦": -1, "累": -1, "讨厌": -2, "无聊": -1,
+    "郁闷": -2, "哭": -1, "难受": -2, "委屈": -2, "焦虑": -2, "崩溃": -2, "害怕": -1
+}
+# 否定词后面不远处的情感词反转（“不开心”“没那么累”）
+NEGATIONS = ("不", "没", "没有", "别", "不太", "不怎么")
+NEGATION_WINDOW = 2  # 否定词结束后隔多少个字以内还算否定
+
+class SentimentScorer:
+    """情感打分：词典编译成Aho-Corasick自动机，一遍扫描同时匹配所有词和否定词"""
+
+    def __init__(self, lexicon=LEXICON, negations=NEGATIONS, negation_window=NEGATION_WINDOW):
+        self.negation_window = negation_window
+        # 节点用并行列表存：转移表、失败指针、该节点结束的最长词(长度, 权重或None表示否定词)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+        for word, weight in lexicon.items():
+            self._add(word, weight)
+        for word in negations:
+            self._add(word, None)
+        self._link()
+
+    def _add(self, word, weight):
+        node = 0
+        for char in word:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+            node = nxt
+        self._out[node] = (len(word), weight)
+
+    def _link(self):
+        """按层建立失败指针；某节点本身不是词尾时继承失败节点上的最长词"""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                if self._out[child] is None:
+                    self._out[child] = self._out[self._fail[child]]
+                queue.append(child)
+
+    def score(self, text):
+        """返回(积极分, 消极分)，都是非负数
+
+        >>> default_scorer.score("还不错哦"), default_scorer.score("不好"), default_scorer.score("不开心")
+        ((1, 0), (0, 1), (0, 2))
+        """
+        positive = negative = 0
+        negated_until = -1    # 到这个位置为止出现的情感词要反转
+        for start, end, weight in self._matches(text):
+            if weight is None:
+                negated_until = end + self.negation_window
+                continue
+            if start <= negated_until:
+                weight = -weight
+                negated_until = -1
+            if weight > 0:
+                positive += weight
+            else:
+                negative -= weight
+        return positive, negative
+
+    def _matches(self, text):
+        """按最左最长挑出互不重叠的词，产出(开始, 结束, 权重)
+
+        同一位置开始的词取最长的，“不错”不会被拆成否定词“不”加“错”。
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        pending = None        # 还可能被更长的词替换的候选(开始, 结束, 权重)
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = out[node]
+            if match is None:
+                continue
+            length, weight = match
+            start = index + 1 - length
+            if pending is not None:
+                if start <= pending[0]:
+                    pending = (start, index + 1, weight)
+                    continue
+                if start < pending[1]:
+                    continue  # 和候选词重叠，保留先开始的
+                yield pending
+            pending = (start, index + 1, weight)
+        if pending is not None:
+            yield pending
+
+    def score_batch(self, texts):
+        """批量打分，返回(积极分数组, 消极分数组)；有numpy时是ndarray，否则是array"""
+        if np is not None:
+            scores = np.fromiter(
+                (value for text in texts for value in self.score(text)), dtype=np.int32
+            ).reshape(-1, 2)
+            return scores[:, 0], scores[:, 1]
+        positive, negative = array("i"), array("i")
+        for text in texts:
+            pos, neg = self.score(text)
+            positive.append(pos)
+            negative.append(neg)
+        return positive, negative
+
+    def energy_deltas(self, texts, positive_weight=2, negative_weight=3):
+        """每条消息对能量值的增减，离线重算存档日志用"""
+        positive, negative = self.score_batch(texts)
+        if np is not None:
+            return positive * positive_weight - negative * negative_weight
+        return array("i", (pos * positive_weight - neg * negative_weight for pos, neg in zip(positive, negative)))
+
+default_scorer = SentimentScorer()
@@ -0,0 +1,251 @@
+"""多进程分片部署：前端进程收更新，按用户ID一致性哈希转给N个工作进程
+
+用法：
+    python3 shard.py --workers 4
+运行中 kill -USR1 <前端pid> 加一个工作进程，kill -USR2 <前端pid> 减一个。
+"""
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import signal
+
+logger = logging.getLogger(__name__)
+
+# 第一个参数是目标用户ID的管理员命令，交给目标用户所在的分片处理
+TARGETED_COMMANDS = ("set_relation", "export")
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """一致性哈希环：每个节点放vnodes个虚拟点，增减节点只搬动约1/N的用户"""
+
+    def __init__(self, nodes=(), vnodes=100):
+        self.vnodes = vnodes
+        self._points = []  # 有序的哈希值
+        self._owners = []  # 与_points一一对应的节点名
+        self.nodes = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.remove(node)
+        kept = [(p, o) for p, o in zip(self._points, self._owners) if o != node]
+        self._points = [p for p, _ in kept]
+        self._owners = [o for _, o in kept]
+
+    def get(self, key):
+        """顺时针找到第一个虚拟点所属的节点"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[index]
+
+def shard_name(index):
+    return f"shard-{index}"
+
+# ========== 工作进程 ==========
+def run_worker(index, inbox, nodes, vnodes):
+    """工作进程入口：自己的事件循环、BotHandlers和内存，只处理分到自己的用户"""
+    import bot
+    asyncio.run(_worker_main(bot, index, inbox, nodes, vnodes))
+
+async def _worker_main(bot, index, inbox, nodes, vnodes):
+    from logs import setup_logging, stop_listener
+    from telegram import Update
+
+    name = shard_name(index)
+    # 每个进程写自己的日志文件，避免多个进程同时轮转同一个文件
+    stop_listener(bot.log_listener)
+    bot.log_listener = setup_logging(
+        f"{bot.LOG_FILE}.{name}",
+        max_bytes=bot.LOG_MAX_BYTES,
+        backup_count=bot.LOG_BACKUP_COUNT,
+        rotate_interval=bot.LOG_ROTATE_INTERVAL,
+        sample_rate=bot.LOG_SAMPLE_RATE
+    )
+    if bot.METRICS_PORT:
+        bot.METRICS_PORT += index + 1
+    if bot.COLD_STATE_FILE:
+        bot.COLD_STATE_FILE = f"{bot.COLD_STATE_FILE}.{name}"
+    ring = HashRing(nodes, vnodes)
+
+    application = bot.build_application(with_updater=False)
+    handlers = application.bot_data["handlers"]
+    handlers.owns = lambda user_id: ring.get(user_id) == name
+    handlers.set_shard_count(len(nodes))
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+    logger.info(f"分片 | {name} 已启动，共{len(nodes)}个分片")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            kind, payload = await loop.run_in_executor(None, inbox.get)
+            if kind == "update":
+                application.update_queue.put_nowait(Update.de_json(payload, application.bot))
+            elif kind == "command":
+                # 管理员的//命令由所属分片回复并写state.json，其他分片只同步内存里的人设和开关
+                bot.ai_core.process_command(payload, persist=False)
+            elif kind == "rebalance":
+                ring = HashRing(payload, vnodes)
+                handlers.set_shard_count(len(payload))
+                handlers.rebalance()
+                logger.info(f"分片 | {name} 重新分配，共{len(payload)}个分片")
+            elif kind == "stop":
+                break
+    finally:
+        # 先把已收下的消息处理完再退出（缩容时这些用户已经转给别的分片）
+        for _ in range(300):
+            if not handlers.scheduler.queued and not handlers.scheduler.in_flight:
+                break
+            await asyncio.sleep(0.1)
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await bot.post_shutdown(application)
+
+# ========== 前端进程 ==========
+class ShardRouter:
+    """前端路由：更新按用户ID哈希到工作进程的队列，支持运行中增减工作进程"""
+
+    def __init__(self, workers, vnodes=100, admins=()):
+        self.ctx = multiprocessing.get_context("spawn")
+        self.vnodes = vnodes
+        self.admins = set(admins)
+        self.ring = HashRing((), vnodes)
+        self.processes = {}
+        self.inboxes = {}
+        self.retired = []  # 已通知停止、还没回收的工作进程
+        self.routed = 0
+        self._target = workers
+
+    def start(self):
+        self.resize(self._target)
+
+    def _spawn(self, index, nodes):
+        name = shard_name(index)
+        inbox = self.ctx.Queue()
+        process = self.ctx.Process(target=run_worker, args=(index, inbox, nodes, self.vnodes), name=name, daemon=True)
+        process.start()
+        self.inboxes[name] = inbox
+        self.processes[name] = process
+
+    def resize(self, workers):
+        """调整工作进程数：新进程先启动，再更新哈希环并通知老进程释放不再属于自己的用户"""
+        workers = max(1, workers)
+        current = len(self.ring.nodes)
+        nodes = [shard_name(i) for i in range(workers)]
+        for index in range(current, workers):
+            self._spawn(index, nodes)
+            self.ring.add(shard_name(index))
+        for index in range(workers, current):
+            name = shard_name(index)
+            self.ring.remove(name)
+            self.inboxes[name].put(("stop", None))
+        for index in range(min(current, workers)):
+            self.inboxes[shard_name(index)].put(("rebalance", nodes))
+        for index in range(workers, current):
+            # 不在事件循环里等它退出，关闭时统一回收
+            name = shard_name(index)
+            self.retired.append(self.processes.pop(name))
+            self.inboxes.pop(name)
+        if current:
+            logger.info(f"分片 | 工作进程 {current} -> {workers}")
+
+    def route_key(self, update):
+        """路由用的用户ID：一般是发送者，管理员的定向命令按目标用户"""
+        user = update.effective_user
+        message = update.effective_message
+        text = (message.text or "") if message else ""
+        if user and str(user.id) in self.admins and text.startswith("/"):
+            command, *args = text.split()
+            if command[1:].split("@")[0] in TARGETED_COMMANDS and args:
+                return args[0]
+        return user.id if user else None
+
+    def route(self, update):
+        user = update.effective_user
+        key = self.route_key(update)
+        name = self.ring.get(key) if key is not None else self.ring.nodes[0]
+        self.inboxes[name].put(("update", update.to_dict()))
+        self.routed += 1
+        message = update.effective_message
+        if user and str(user.id) in self.admins and message and (message.text or "").lstrip().startswith("//"):
+            for other in self.ring.nodes:
+                if other != name:
+                    self.inboxes[other].put(("command", message.text.strip()[2:]))
+
+    def close(self):
+        for inbox in self.inboxes.values():
+            inbox.put(("stop", None))
+        for process in list(self.processes.values()) + self.retired:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+
+def build_front_application(router):
+    """前端只收更新（长轮询或webhook），所有处理都在工作进程"""
+    import bot
+    from telegram import Update
+    from telegram.ext import Application, TypeHandler
+
+    async def forward(update, context):
+        router.route(update)
+
+    async def front_post_init(application):
+        router.start()
+        loop = asyncio.get_running_loop()
+        for sig, delta in ((signal.SIGUSR1, 1), (signal.SIGUSR2, -1)):
+            try:
+                loop.add_signal_handler(sig, lambda d=delta: router.resize(len(router.ring.nodes) + d))
+            except (NotImplementedError, AttributeError):
+                pass
+
+    async def front_post_shutdown(application):
+        router.close()
+
+    application = (
+        Application.builder()
+        .token(bot.TELEGRAM_TOKEN)
+        .post_init(front_post_init)
+        .post_shutdown(front_post_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, forward))
+    return application
+
+def main(argv=None):
+    import bot
+    parser = argparse.ArgumentParser(description="多进程分片运行Bot")
+    parser.add_argument("--workers", type=int, default=bot.SHARD_WORKERS, help="工作进程数")
+    parser.add_argument("--vnodes", type=int, default=bot.SHARD_VNODES, help="每个工作进程的虚拟节点数")
+    args = parser.parse_args(argv)
+
+    router = ShardRouter(args.workers, args.vnodes, bot.ADMINS)
+    application = build_front_application(router)
+    print(f"\n💬 分片模式启动：{args.workers}个工作进程")
+    # webhook模式复用bot.py的内嵌服务器，更新进入前端队列后被转发
+    if bot.UPDATE_MODE == "webhook":
+        asyncio.run(bot.run_webhook(application))
+    else:
+        application.run_polling(timeout=30)
+
+if __name__ == "__main__":
+    main()
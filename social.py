@@ -1,49 +1,83 @@
-import json
-import networkx as nx
-from datetime import datetime
+from itertools import islice
+
+UNIQUE_RELATIONS = ("best_friend", "love", "family")  # 同一时间只能有一个人的关系
 
 class SocialNetwork:
+    """关系索引：用户->关系、关系->用户的反向索引，唯一关系直接记录持有者
+
+    networkx只在做图分析时才导入（见 graph 属性）。
+    """
+
     def __init__(self):
-        self.graph = nx.Graph()
-        self.graph.add_node("AI")
-        self.relationships = {}
-        
+        self.relationships = {}  # 用户 -> 关系
+        self.by_relation = {}    # 关系 -> {用户: None}，用dict当有序集合，分页顺序稳定
+        self.unique_holders = {} # 唯一关系 -> 当前持有者
+        self.users = set()       # 出现过的所有用户（包括被挤掉唯一关系的）
+        self._graph = None
+
     def add_relationship(self, user_id, rel_type):
         """添加关系"""
         uid = str(user_id)
-        self.graph.add_node(uid)
-        self.graph.add_edge("AI", uid, relationship=rel_type)
+        self.users.add(uid)
+        self._remove(uid)
+
+        # 唯一关系检查：挤掉旧的持有者
+        if rel_type in UNIQUE_RELATIONS:
+            holder = self.unique_holders.get(rel_type)
+            if holder is not None and holder != uid:
+                self._remove(holder)
+            self.unique_holders[rel_type] = uid
+
         self.relationships[uid] = rel_type
-        
-        # 唯一关系检查
-        unique_rels = ["best_friend", "love", "family"]
-        if rel_type in unique_rels:
-            # 检查是否已有该关系
-            for node, data in self.graph.nodes(data=True):
-                if node != "AI" and self.graph.has_edge("AI", node):
-                    edge_data = self.graph.get_edge_data("AI", node)
-                    if edge_data.get("relationship") == rel_type and node != uid:
-                        # 移除旧的关系
-                        self.graph.remove_edge("AI", node)
-    
-    def get_network_info(self):
-        """获取网络信息"""
+        self.by_relation.setdefault(rel_type, {})[uid] = None
+        self._graph = None
+
+    def _remove(self, uid):
+        rel_type = self.relationships.pop(uid, None)
+        if rel_type is None:
+            return
+        members = self.by_relation[rel_type]
+        del members[uid]
+        if not members:
+            del self.by_relation[rel_type]
+        if self.unique_holders.get(rel_type) == uid:
+            del self.unique_holders[rel_type]
+        self._graph = None
+
+    def get_relationship(self, user_id):
+        return self.relationships.get(str(user_id))
+
+    def count(self, rel_type):
+        return len(self.by_relation.get(rel_type, ()))
+
+    def get_network_info(self, offset=0, limit=100):
+        """获取网络信息，关系和连接按页返回"""
+        page = dict(islice(self.relationships.items(), offset, offset + limit))
         return {
-            "total_users": len(self.graph.nodes()) - 1,
-            "relationships": dict(self.relationships),
-            "connections": list(self.graph.edges(data=True))
+            "total_users": len(self.users),
+            "counts": {rel_type: len(members) for rel_type, members in self.by_relation.items()},
+            "relationships": page,
+            "connections": [("AI", uid, {"relationship": rel_type}) for uid, rel_type in page.items()],
+            "offset": offset,
+            "has_more": offset + limit < len(self.relationships)
         }
-    
-    def find_similar_users(self, user_id):
-        """寻找相似用户"""
+
+    def find_similar_users(self, user_id, limit=3):
+        """寻找相似用户（同一关系的其他人）"""
         uid = str(user_id)
-        if uid not in self.relationships:
+        rel_type = self.relationships.get(uid)
+        if rel_type is None:
             return []
-        
-        similar = []
-        for node in self.graph.nodes():
-            if node != "AI" and node != uid:
-                if self.relationships.get(node) == self.relationships[uid]:
-                    similar.append(node)
-        
-        return similar[:3]
\ No newline at end of file
+        return list(islice((node for node in self.by_relation[rel_type] if node != uid), limit))
+
+    @property
+    def graph(self):
+        """networkx图，只在分析时按需构建"""
+        if self._graph is None:
+            import networkx as nx
+            graph = nx.Graph()
+            graph.add_node("AI")
+            graph.add_nodes_from(self.users)
+            graph.add_edges_from(("AI", uid, {"relationship": rel_type}) for uid, rel_type in self.relationships.items())
+            self._graph = graph
+        return self._graph
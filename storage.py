@@ -0,0 +1,165 @@
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    first_seen INTEGER NOT NULL,
+    last_active INTEGER NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS relationships (
+    user_id TEXT PRIMARY KEY,
+    rel_type TEXT NOT NULL,
+    locked INTEGER NOT NULL DEFAULT 0,
+    updated_at INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    timestamp INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user_time ON messages(user_id, timestamp);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+"""
+
+# 热路径SQL固定为模块常量，sqlite3按语句文本缓存编译结果，相当于预编译语句
+SQL_INSERT_MESSAGE = "INSERT INTO messages (user_id, role, content, timestamp) VALUES (?, ?, ?, ?)"
+# last_active只记用户自己发消息的时间（Bot的回复、主动消息传0不会更新），主动消息按它安排
+SQL_TOUCH_USER = """
+INSERT INTO users (user_id, first_seen, last_active, message_count) VALUES (?, ?, ?, 1)
+ON CONFLICT(user_id) DO UPDATE SET
+    last_active = MAX(last_active, excluded.last_active), message_count = message_count + 1
+"""
+SQL_RECENT_MESSAGES = """
+SELECT role, content, timestamp FROM messages WHERE user_id = ?
+ORDER BY timestamp DESC, id DESC LIMIT ?
+"""
+SQL_PAGE_MESSAGES = """
+SELECT id, role, content, timestamp FROM messages
+WHERE user_id = ? AND (timestamp, id) > (?, ?) AND timestamp < ?
+ORDER BY timestamp, id LIMIT ?
+"""
+SQL_GET_RELATIONSHIP = "SELECT rel_type, locked FROM relationships WHERE user_id = ?"
+SQL_SET_RELATIONSHIP = """
+INSERT INTO relationships (user_id, rel_type, locked, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET rel_type = excluded.rel_type, locked = excluded.locked,
+    updated_at = excluded.updated_at
+"""
+SQL_GET_SUMMARY = "SELECT summary FROM summaries WHERE user_id = ?"
+SQL_SET_SUMMARY = """
+INSERT INTO summaries (user_id, summary, updated_at) VALUES (?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET summary = excluded.summary, updated_at = excluded.updated_at
+"""
+SQL_GET_USER = "SELECT first_seen, last_active, message_count FROM users WHERE user_id = ?"
+SQL_USER_ACTIVITY = """
+SELECT u.user_id, u.last_active, COALESCE(r.rel_type, 'stranger') FROM users u
+LEFT JOIN relationships r ON r.user_id = u.user_id
+WHERE u.last_active > 0
+"""
+SCHEMA_VERSION = 1
+# 版本0的last_active也被Bot的回复更新过，按用户自己最后一条消息重算一次
+SQL_MIGRATE_LAST_ACTIVE = """
+UPDATE users SET last_active = COALESCE(
+    (SELECT MAX(timestamp) FROM messages m WHERE m.user_id = users.user_id AND m.role = 'user'), 0)
+"""
+
+class SQLiteStore:
+    """SQLite对话存储（WAL模式），重启不丢历史"""
+
+    def __init__(self, db_path="chat.db", readonly=False):
+        self.db_path = db_path
+        if readonly:
+            # 只读连接（导出等后台线程用），WAL下和主连接的写入互不阻塞
+            self.conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, cached_statements=64)
+            return
+        self.conn = sqlite3.connect(db_path, cached_statements=64)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 手机内存小，页缓存控制在约2MB
+        self.conn.execute("PRAGMA cache_size=-2000")
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with self.conn:
+                self.conn.execute(SQL_MIGRATE_LAST_ACTIVE)
+                self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def add_message(self, user_id, role, content, timestamp=None):
+        """追加一条消息并更新用户活跃时间"""
+        ts = int(timestamp if timestamp is not None else time.time())
+        with self.conn:
+            self.conn.execute(SQL_INSERT_MESSAGE, (user_id, role, content, ts))
+            self.conn.execute(SQL_TOUCH_USER, (user_id, ts, ts if role == "user" else 0))
+
+    def get_recent(self, user_id, limit):
+        """最近limit条消息，按时间正序返回"""
+        rows = self.conn.execute(SQL_RECENT_MESSAGES, (user_id, limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def iter_messages(self, user_id, since=0, until=None, limit=None, page_size=500):
+        """按时间顺序分页读取消息，一次只在内存里保留一页"""
+        until = until if until is not None else 2 ** 62
+        last_ts, last_id = since, 0  # 自增id从1开始，(since, 0)之后正好是since当秒的第一条
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = page_size if remaining is None else min(page_size, remaining)
+            rows = self.conn.execute(
+                SQL_PAGE_MESSAGES, (user_id, last_ts, last_id, until, size)
+            ).fetchall()
+            if not rows:
+                return
+            for msg_id, role, content, ts in rows:
+                yield role, content, ts
+            last_id, _, _, last_ts = rows[-1]
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < size:
+                return
+
+    def get_relationship(self, user_id):
+        """返回(关系, 是否锁定)，没有记录时返回None"""
+        row = self.conn.execute(SQL_GET_RELATIONSHIP, (user_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], bool(row[1])
+
+    def set_relationship(self, user_id, rel_type, locked=False):
+        with self.conn:
+            self.conn.execute(SQL_SET_RELATIONSHIP, (user_id, rel_type, int(locked), int(time.time())))
+
+    def get_summary(self, user_id):
+        row = self.conn.execute(SQL_GET_SUMMARY, (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_summary(self, user_id, summary):
+        with self.conn:
+            self.conn.execute(SQL_SET_SUMMARY, (user_id, summary, int(time.time())))
+
+    def get_user_stats(self, user_id):
+        """返回(首次出现, 最近活跃, 消息数)，没有记录时返回None"""
+        return self.conn.execute(SQL_GET_USER, (user_id,)).fetchone()
+
+    def iter_user_activity(self):
+        """逐行产出(用户ID, 最近活跃, 关系)，启动时恢复主动消息计划用"""
+        yield from self.conn.execute(SQL_USER_ACTIVITY)
+
+    def has_user(self, user_id):
+        return self.get_user_stats(user_id) is not None
+
+    def count_users(self):
+        return self.conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def count_messages(self, user_id=None):
+        if user_id is None:
+            return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return self.conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
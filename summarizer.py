@@ -0,0 +1,77 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = """你负责整理聊天记忆。把已有摘要和新的对话合并成一段简短摘要（150字以内），
+保留对方的个人信息、喜好、约定和发生过的重要事情，用第三人称，只输出摘要本身。"""
+
+def build_summary_messages(summary, turns):
+    """把旧摘要和被挤出窗口的对话拼成摘要请求"""
+    lines = [f"{'用户' if msg.role == 'user' else 'Bot'}: {msg.content}" for msg in turns]
+    content = f"已有摘要：{summary or '无'}\n\n新对话：\n" + "\n".join(lines)
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": content}
+    ]
+
+class Summarizer:
+    """后台滚动摘要：旧对话攒够一批后压缩进用户摘要，不占回复的热路径"""
+
+    def __init__(self, memory, complete, threshold=6, batch_size=4, interval=10.0, is_busy=None):
+        self.memory = memory          # 需提供 take_evicted / restore_evicted / get_summary / set_summary
+        self.complete = complete      # async complete(messages) -> str
+        self.threshold = threshold    # 挤出多少条消息后触发摘要
+        self.batch_size = batch_size
+        self.interval = interval
+        self.is_busy = is_busy        # 返回True时让路给实时回复
+        self.pending = {}             # 按加入顺序排队的用户ID
+        self.done_count = 0
+        self.failed_count = 0
+        self._task = None
+
+    def notify(self, user_id, evicted_count):
+        """记忆层挤出旧消息后调用，够数就排进摘要队列"""
+        if evicted_count >= self.threshold:
+            self.pending[user_id] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.pending or (self.is_busy and self.is_busy()):
+                continue
+            await self.run_batch()
+
+    async def run_batch(self):
+        """取出一批用户并发生成摘要"""
+        batch = []
+        for user_id in list(self.pending)[:self.batch_size]:
+            del self.pending[user_id]
+            batch.append(user_id)
+        await asyncio.gather(*(self._summarize(user_id) for user_id in batch))
+
+    async def _summarize(self, user_id):
+        turns = self.memory.take_evicted(user_id)
+        if not turns:
+            return
+        try:
+            summary = await self.complete(build_summary_messages(self.memory.get_summary(user_id), turns))
+        except Exception as e:
+            # 失败的对话放回去，下次和新挤出的一起摘要
+            self.memory.restore_evicted(user_id, turns)
+            self.failed_count += 1
+            logger.warning(f"用户[{user_id}] | 摘要失败: {str(e)}")
+            return
+        if summary:
+            self.memory.set_summary(user_id, summary.strip())
+            self.done_count += 1
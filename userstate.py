@@ -0,0 +1,196 @@
+import marshal
+import os
+import time
+from collections import OrderedDict
+
+class ColdStore:
+    """冷用户溢出文件：marshal记录追加写入，内存里只留 键 -> (偏移, 长度)
+
+    这里只是内存的溢出区，持久化仍靠数据库，所以第一次换出时才创建（清空）文件，
+    close时删除。废弃的记录超过一半时整理一次文件。
+    """
+
+    def __init__(self, path, compact_min_bytes=1024 * 1024):
+        self.path = path
+        self.compact_min_bytes = compact_min_bytes
+        self.index = {}
+        self._file = None
+        self._size = 0   # 文件总字节数
+        self._live = 0   # 仍被索引引用的字节数
+
+    def put(self, key, value):
+        data = marshal.dumps(value)
+        if self._file is None:
+            self._file = open(self.path, "w+b")
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(data)
+        self._drop(key)
+        self.index[key] = (self._size, len(data))
+        self._size += len(data)
+        self._live += len(data)
+        if self._size >= self.compact_min_bytes and self._live * 2 < self._size:
+            self.compact()
+
+    def get(self, key):
+        """读取记录但不移除，不存在返回None"""
+        entry = self.index.get(key)
+        if entry is None:
+            return None
+        self._file.seek(entry[0])
+        return marshal.loads(self._file.read(entry[1]))
+
+    def take(self, key):
+        """读取并移除记录（用户回到内存）"""
+        value = self.get(key)
+        self._drop(key)
+        return value
+
+    def discard(self, key):
+        self._drop(key)
+
+    def _drop(self, key):
+        entry = self.index.pop(key, None)
+        if entry is not None:
+            self._live -= entry[1]
+
+    def compact(self):
+        """只保留仍在索引里的记录，写到临时文件后原子替换"""
+        tmp_path = f"{self.path}.tmp"
+        index = {}
+        offset = 0
+        with open(tmp_path, "wb") as out:
+            for key, (start, length) in self.index.items():
+                self._file.seek(start)
+                out.write(self._file.read(length))
+                index[key] = (offset, length)
+                offset += length
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "r+b")
+        self.index = index
+        self._size = self._live = offset
+
+    def close(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self.index.clear()
+        self._size = self._live = 0
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(list(self.index))
+
+class TieredUsers:
+    """两级用户状态：热用户在内存LRU里（按最近活跃排序），冷用户序列化到ColdStore
+
+    dump/load 负责内存对象和marshal能序列化的元组之间的转换；
+    pinned(key, data) 返回True的用户（锁定用户、正在处理的用户）不会被换出。
+    cold为None时换出的用户直接丢弃，下次从数据库重新加载。
+    """
+
+    def __init__(self, dump, load, cold=None, max_hot=1000, idle_after=None,
+                 last_active=lambda data: data["last_active"], pinned=None):
+        self.dump = dump
+        self.load = load
+        self.cold = cold
+        self.max_hot = max_hot          # 内存里最多保留的用户数
+        self.idle_after = idle_after    # 沉默超过这么久（秒）的用户即使没超预算也换出
+        self.last_active = last_active
+        self.pinned = pinned
+        self.hot = OrderedDict()        # 最久没活跃的在前
+        self.evicted_count = 0
+        self.loaded_count = 0
+
+    def get(self, key):
+        """取热用户，冷用户先换回内存；都没有返回None"""
+        data = self.hot.get(key)
+        if data is None and self.cold is not None:
+            record = self.cold.take(key)
+            if record is not None:
+                # 放在LRU队头：读回不等于活跃，没有新消息的话下次换出时最先被换出
+                data = self.hot[key] = self.load(record)
+                self.hot.move_to_end(key, last=False)
+                self.loaded_count += 1
+        return data
+
+    def peek(self, key):
+        """只读：热用户返回内存对象，冷用户返回dump后的记录，不换回内存也不改LRU顺序"""
+        data = self.hot.get(key)
+        if data is None and self.cold is not None:
+            return self.cold.get(key)
+        return data
+
+    def __setitem__(self, key, data):
+        if self.cold is not None:
+            self.cold.discard(key)
+        if key not in self.hot:
+            # 先腾出位置再放入：连续来很多新用户时预算也守得住，新用户自己不会刚放进来就被换出
+            self.evict(extra=1)
+        self.hot[key] = data
+
+    def __getitem__(self, key):
+        data = self.get(key)
+        if data is None:
+            raise KeyError(key)
+        return data
+
+    def __delitem__(self, key):
+        """彻底移除（热、冷两级都删）"""
+        found = self.hot.pop(key, None) is not None
+        if self.cold is not None and key in self.cold:
+            self.cold.discard(key)
+            found = True
+        if not found:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.hot or (self.cold is not None and key in self.cold)
+
+    def __len__(self):
+        return len(self.hot)
+
+    @property
+    def cold_count(self):
+        return len(self.cold) if self.cold is not None else 0
+
+    def __iter__(self):
+        yield from list(self.hot)
+        if self.cold is not None:
+            yield from self.cold
+
+    def touch(self, key, now=None):
+        """用户刚活跃过：移到LRU末尾，再按预算和沉默时间换出最久没活跃的"""
+        if key in self.hot:
+            self.hot.move_to_end(key)
+        self.evict(now)
+
+    def evict(self, now=None, extra=0):
+        """extra是马上要放进来的用户数，按放进来之后的总数算预算"""
+        now = time.time() if now is None else now
+        # 每个用户最多看一次，被固定的挪到末尾，避免在队头反复检查
+        for _ in range(len(self.hot)):
+            key, data = next(iter(self.hot.items()))
+            over_budget = self.max_hot is not None and len(self.hot) + extra > self.max_hot
+            idle = self.idle_after is not None and now - self.last_active(data) > self.idle_after
+            if not over_budget and not idle:
+                break
+            if self.pinned and self.pinned(key, data):
+                self.hot.move_to_end(key)
+                continue
+            del self.hot[key]
+            if self.cold is not None:
+                self.cold.put(key, self.dump(data))
+            self.evicted_count += 1
+
+    def close(self):
+        if self.cold is not None:
+            self.cold.close()
@@ -0,0 +1,56 @@
+import hmac
+import logging
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """内嵌aiohttp服务器接收Telegram推送：校验密钥、立即确认、交给更新队列"""
+
+    def __init__(self, application, path="/telegram", secret_token=None, host="127.0.0.1", port=8443):
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token
+        self.host = host
+        self.port = port
+        self.received = 0
+        self.rejected = 0
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_update)
+        self._runner = None
+
+    async def handle_update(self, request):
+        if self.secret_token:
+            token = request.headers.get(SECRET_HEADER, "")
+            # 按字节比较：compare_digest对含非ASCII字符的str会抛TypeError
+            if not hmac.compare_digest(token.encode("utf-8", "surrogateescape"), self.secret_token.encode("utf-8")):
+                self.rejected += 1
+                return web.Response(status=403)
+        try:
+            data = await request.json()
+            # {}、[]、null 之类的请求体de_json会返回None，不能放进更新队列
+            update = Update.de_json(data, self.application.bot) if isinstance(data, dict) else None
+            if update is None:
+                raise ValueError("empty update")
+        except Exception as e:
+            self.rejected += 1
+            logger.warning(f"Webhook | 无法解析的更新: {str(e)}")
+            return web.Response(status=400)
+        # 只入队不处理，马上给Telegram回200
+        self.application.update_queue.put_nowait(update)
+        self.received += 1
+        return web.Response()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Webhook | 监听 {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None